@@ -0,0 +1,94 @@
+import io
+import os
+import csv
+import gzip
+import logging
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from common.instrumentation import instrument_stage
+
+
+logger = logging.getLogger()
+
+EXPORT_BATCH_SIZE = 10000
+EXPORT_COMPRESSIONS = (None, "gzip", "zstd")
+SQLITE_ARROW_TYPES = {"INTEGER": pa.int64(), "REAL": pa.float64()}
+
+
+def open_export_file(output_path, compression=None):
+    """
+    Abre el archivo de exportación en modo texto, opcionalmente comprimido
+    con gzip o zstd (este último con el flujo comprimido de pyarrow).
+    """
+    if compression is None:
+        return open(output_path, "w", newline="", encoding="utf-8")
+    if compression == "gzip":
+        return gzip.open(output_path, "wt", newline="", encoding="utf-8")
+    if compression == "zstd":
+        return io.TextIOWrapper(pa.CompressedOutputStream(output_path, "zstd"), encoding="utf-8", newline="")
+    raise ValueError(f"Compresión no soportada: {compression}")
+
+
+def sqlite_table_schema(conn, table_name):
+    """
+    Esquema Arrow de una tabla a partir de los tipos declarados en SQLite.
+    """
+    return pa.schema([
+        (row[1], SQLITE_ARROW_TYPES.get(row[2].upper(), pa.string()))
+        for row in conn.execute(f"PRAGMA table_info({table_name})")
+    ])
+
+
+@instrument_stage()
+def export_table_to_csv(conn, table_name, output_path, batch_size=EXPORT_BATCH_SIZE, compression=None):
+    """
+    Exporta una tabla a CSV leyendo con `fetchmany` y escribiendo por lotes
+    para no cargar la tabla en memoria. Devuelve el número de filas.
+    """
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    cursor = conn.execute(f"SELECT * FROM {table_name}")
+    columns = [description[0] for description in cursor.description]
+    total = 0
+
+    with open_export_file(output_path, compression) as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(columns)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            writer.writerows(rows)
+            total += len(rows)
+    logger.info(f"Tabla `{table_name}` exportada a CSV: {output_path} ({total} filas)")
+    return total
+
+
+@instrument_stage()
+def export_table_to_parquet(conn, table_name, output_path, batch_size=EXPORT_BATCH_SIZE, compression="zstd"):
+    """
+    Exporta una tabla a Parquet escribiendo un row group por cada lote de
+    `fetchmany`, con el esquema de `sqlite_table_schema`. Devuelve el número
+    de filas.
+    """
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    schema = sqlite_table_schema(conn, table_name)
+    cursor = conn.execute(f"SELECT {', '.join(schema.names)} FROM {table_name}")
+    total = 0
+
+    with pq.ParquetWriter(output_path, schema, compression=compression) as writer:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            arrays = [
+                pa.array(values, type=field.type)
+                for values, field in zip(zip(*rows), schema)
+            ]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            total += len(rows)
+    logger.info(f"Tabla `{table_name}` exportada a Parquet: {output_path} ({total} filas)")
+    return total
@@ -0,0 +1,281 @@
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import threading
+import functools
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+logger = logging.getLogger()
+
+_current_run = {
+    "pipeline": None,
+    "started_at": None,
+    "start": None,
+    "stages": {},
+}
+
+_stages_lock = threading.Lock()
+
+TIME_FIELDS = ("wall_seconds", "cpu_seconds", "thread_cpu_seconds")
+MEMORY_FIELDS = ("rss_delta_mb", "peak_rss_increase_mb")
+SUMMED_FIELDS = ("rows_in", "rows_out", "rows_written") + TIME_FIELDS + MEMORY_FIELDS
+
+
+def to_mb(value):
+    """
+    Convierte un valor de `ru_maxrss` a MB (Linux reporta KB y macOS bytes).
+    """
+    return value / (1024 * 1024) if sys.platform == "darwin" else value / 1024
+
+
+def peak_rss_mb():
+    """
+    Memoria residente máxima del proceso en MB (None si no se puede medir).
+    Es el máximo desde el inicio del proceso: nunca disminuye.
+    """
+    if resource is None:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+
+    return to_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def current_rss_mb():
+    """
+    Memoria residente actual del proceso en MB (None si no se puede medir).
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def children_cpu_seconds():
+    """
+    Tiempo de CPU (usuario + sistema) de los procesos hijos ya terminados.
+    """
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def difference(end, start):
+    """
+    Diferencia entre dos mediciones que pueden ser None.
+    """
+    return round(end - start, 2) if end is not None and start is not None else None
+
+
+def count_rows(obj):
+    """
+    Número de filas de un DataFrame, arreglo, tabla Arrow, lista o resumen
+    con llave `rows`. Devuelve None para cualquier otro objeto.
+    """
+    if obj is None or isinstance(obj, (str, bytes, bool)):
+        return None
+    if isinstance(obj, int):
+        return obj
+    if isinstance(obj, dict):
+        rows = obj.get("rows", obj.get("records"))
+        return rows if isinstance(rows, int) else None
+    if isinstance(obj, list):
+        return len(obj)
+    shape = getattr(obj, "shape", None)
+    if shape:
+        return shape[0]
+    num_rows = getattr(obj, "num_rows", None)
+    return num_rows if isinstance(num_rows, int) else None
+
+
+def start_run(pipeline):
+    """
+    Inicia un nuevo reporte de ejecución y descarta las etapas anteriores.
+    """
+    _current_run["pipeline"] = pipeline
+    _current_run["started_at"] = datetime.now().isoformat(timespec="seconds")
+    _current_run["start"] = time.perf_counter()
+    _current_run["stages"] = {}
+    logger.info(f"Inicio del reporte de ejecución: {pipeline}")
+
+
+def add_value(total, value):
+    """
+    Suma dos valores que pueden ser None.
+    """
+    if value is None:
+        return total
+    return value if total is None else total + value
+
+
+def record_stage(record):
+    """
+    Agrega el registro al reporte. Las llamadas repetidas a una misma etapa
+    (p. ej. por lote) se acumulan en una sola entrada con su número de llamadas.
+    """
+    with _stages_lock:
+        merge_stage_record(_current_run["stages"], record)
+
+
+def merge_stage_record(stages, record):
+    current = stages.get(record["stage"])
+    if current is None:
+        stages[record["stage"]] = dict(record, calls=1)
+        return
+
+    current["calls"] += 1
+    for field in SUMMED_FIELDS:
+        current[field] = add_value(current[field], record[field])
+    if record["status"] == "error":
+        current["status"] = "error"
+        current["error"] = record.get("error")
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Mide una etapa: tiempo real, tiempo de CPU, memoria y filas.
+    El registro entregado puede completarse, p. ej. `record["rows_out"] = n`.
+
+    * `cpu_seconds`: CPU de todo el proceso (`process_time`, incluye los hilos
+      de trabajo) más la de los procesos hijos que terminaron durante la etapa
+      (p. ej. un `ProcessPoolExecutor` cerrado dentro de ella). Si otras etapas
+      corren en paralelo en el mismo proceso, su CPU también se suma aquí.
+    * `thread_cpu_seconds`: CPU del hilo que ejecuta la etapa.
+    * `rss_delta_mb`: memoria residente al terminar menos la del inicio; es la
+      memoria que la etapa deja retenida (negativa si libera).
+    * `peak_rss_increase_mb`: cuánto subió durante la etapa el máximo histórico
+      de RSS del proceso; sólo es mayor que 0 si la etapa marcó un nuevo pico.
+    """
+    record = {
+        "stage": name,
+        "status": "ok",
+        "rows_in": rows_in,
+        "rows_out": None,
+        "rows_written": None,
+    }
+    rss_start = current_rss_mb()
+    peak_start = peak_rss_mb()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time() + children_cpu_seconds()
+    thread_cpu_start = time.thread_time()
+    try:
+        yield record
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+        raise
+    finally:
+        record["wall_seconds"] = round(time.perf_counter() - wall_start, 6)
+        record["cpu_seconds"] = round(time.process_time() + children_cpu_seconds() - cpu_start, 6)
+        record["thread_cpu_seconds"] = round(time.thread_time() - thread_cpu_start, 6)
+        record["rss_delta_mb"] = difference(current_rss_mb(), rss_start)
+        record["peak_rss_increase_mb"] = difference(peak_rss_mb(), peak_start)
+        record_stage(record)
+
+
+def find_connection(args, kwargs):
+    """
+    Primera conexión SQLite entre los argumentos de una función.
+    """
+    for value in list(args) + list(kwargs.values()):
+        if isinstance(value, sqlite3.Connection):
+            return value
+    return None
+
+
+def find_rows_in(args, kwargs):
+    """
+    Filas del primer argumento con forma de tabla (DataFrame, lista, ...).
+    """
+    for value in list(args) + list(kwargs.values()):
+        if isinstance(value, (sqlite3.Connection, str, int, dict)):
+            continue
+        rows = count_rows(value)
+        if rows is not None:
+            return rows
+    return None
+
+
+def instrument_stage(name=None):
+    """
+    Decorador que registra la función como etapa del reporte de ejecución.
+    Si la función recibe una conexión SQLite también registra las filas
+    modificadas (`total_changes`).
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            conn = find_connection(args, kwargs)
+            changes_before = conn.total_changes if conn is not None else None
+            with stage(stage_name, rows_in=find_rows_in(args, kwargs)) as record:
+                try:
+                    result = func(*args, **kwargs)
+                finally:
+                    if conn is not None:
+                        try:
+                            record["rows_written"] = conn.total_changes - changes_before
+                        except sqlite3.ProgrammingError:
+                            pass
+                record["rows_out"] = count_rows(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def get_run_report():
+    """
+    Devuelve el reporte de la ejecución actual como diccionario.
+    """
+    start = _current_run["start"]
+    rss = peak_rss_mb()
+    return {
+        "pipeline": _current_run["pipeline"],
+        "started_at": _current_run["started_at"],
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "total_wall_seconds": round(time.perf_counter() - start, 6) if start is not None else None,
+        "peak_rss_mb": round(rss, 2) if rss is not None else None,
+        "stages": [
+            dict(
+                record,
+                **{field: round(record[field], 6) for field in TIME_FIELDS},
+                **{field: round(record[field], 2) for field in MEMORY_FIELDS if record[field] is not None}
+            )
+            for record in _current_run["stages"].values()
+        ],
+    }
+
+
+def write_run_report(output_path):
+    """
+    Escribe el reporte de la ejecución actual como JSON.
+    """
+    report = get_run_report()
+    with open(output_path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    logger.info(f"Reporte de ejecución guardado en: {output_path}")
+    return report
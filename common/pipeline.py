@@ -0,0 +1,265 @@
+import os
+import json
+import pickle
+import hashlib
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+logger = logging.getLogger()
+
+STATE_VERSION = 1
+
+
+def stable_repr(value):
+    """
+    Representación estable de un parámetro para la huella de una etapa: las
+    funciones se representan por su módulo y nombre (no por su dirección).
+    """
+    if callable(value):
+        return f"{getattr(value, '__module__', '')}.{getattr(value, '__qualname__', repr(value))}"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{key!r}: {stable_repr(value[key])}" for key in sorted(value)) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(stable_repr(item) for item in value) + "]"
+    return repr(value)
+
+
+def file_signature(file_path):
+    """
+    Firma barata de un archivo de entrada: tamaño y fecha de modificación.
+    """
+    if not os.path.exists(file_path):
+        return None
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class Stage:
+    """
+    Etapa del pipeline.
+
+    * `inputs`: {argumento: etapa} cuyos resultados se pasan a la función.
+    * `params`: argumentos fijos.
+    * `after`: etapas que deben terminar antes, sin pasar su resultado.
+    * `input_files` / `output_files`: archivos leídos y generados por la etapa.
+    * `cache_result`: guarda el resultado (pickle) para poder omitir la etapa
+      aunque una etapa posterior lo necesite.
+    """
+
+    def __init__(self, name, func, inputs=None, params=None, after=(), input_files=(), output_files=(),
+                 cache_result=True):
+        self.name = name
+        self.func = func
+        self.inputs = dict(inputs or {})
+        self.params = dict(params or {})
+        self.after = list(after)
+        self.input_files = list(input_files)
+        self.output_files = list(output_files)
+        self.cache_result = cache_result
+
+    @property
+    def dependencies(self):
+        return list(dict.fromkeys(list(self.inputs.values()) + self.after))
+
+    def fingerprint(self, upstream_fingerprints):
+        payload = json.dumps({
+            "func": stable_repr(self.func),
+            "params": stable_repr(self.params),
+            "inputs": sorted(self.inputs.items()),
+            "input_files": {path: file_signature(path) for path in self.input_files},
+            "upstream": upstream_fingerprints,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Pipeline:
+    """
+    Ejecutor de etapas en forma de DAG. Las etapas independientes se ejecutan
+    en paralelo (hilos), una etapa se omite si su huella (función, parámetros,
+    archivos de entrada y etapas anteriores) no cambió desde su última
+    ejecución exitosa y sus archivos de salida existen, y tras un fallo la
+    siguiente ejecución continúa desde las etapas que no terminaron.
+    """
+
+    def __init__(self, name, state_dir, workers=4):
+        self.name = name
+        self.state_dir = state_dir
+        self.workers = workers
+        self.stages = {}
+
+    @property
+    def state_path(self):
+        return os.path.join(self.state_dir, f"{self.name}_state.json")
+
+    def result_path(self, stage_name):
+        return os.path.join(self.state_dir, self.name, f"{stage_name}.pkl")
+
+    def add_stage(self, name, func, **kwargs):
+        if name in self.stages:
+            raise ValueError(f"Etapa duplicada en el pipeline: {name}")
+        self.stages[name] = Stage(name, func, **kwargs)
+        return self.stages[name]
+
+    def topological_order(self):
+        """
+        Orden de ejecución de las etapas; valida dependencias y ciclos.
+        """
+        order, visiting, visited = [], set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Ciclo en el pipeline en la etapa: {name}")
+            if name not in self.stages:
+                raise ValueError(f"Etapa desconocida en el pipeline: {name}")
+            visiting.add(name)
+            for dependency in self.stages[name].dependencies:
+                visit(dependency)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"No se pudo leer el estado del pipeline, se ejecuta completo: {e}")
+            return {}
+        return state.get("stages", {}) if state.get("version") == STATE_VERSION else {}
+
+    def save_state(self, state):
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"version": STATE_VERSION, "pipeline": self.name, "stages": state}, file, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def is_up_to_date(self, stage, fingerprint, previous):
+        if not previous or previous.get("status") != "ok" or previous.get("fingerprint") != fingerprint:
+            return False
+        if not all(os.path.exists(path) for path in stage.output_files):
+            return False
+        if previous.get("result") == "pickle":
+            return os.path.exists(self.result_path(stage.name))
+        return previous.get("result") == "none"
+
+    def plan(self, state, force=False):
+        """
+        Calcula la huella de cada etapa y decide cuáles se ejecutan. Una etapa
+        se ejecuta si cambió o si alguna de sus dependencias se ejecuta.
+        """
+        fingerprints, to_run = {}, set()
+        for name in self.topological_order():
+            stage = self.stages[name]
+            fingerprints[name] = stage.fingerprint(
+                {dependency: fingerprints[dependency] for dependency in stage.dependencies}
+            )
+            if (force or any(dependency in to_run for dependency in stage.dependencies)
+                    or not self.is_up_to_date(stage, fingerprints[name], state.get(name))):
+                to_run.add(name)
+        return fingerprints, to_run
+
+    def store_result(self, stage, result):
+        """
+        Guarda el resultado de la etapa y devuelve cómo quedó guardado.
+        """
+        if result is None:
+            return "none"
+        if not stage.cache_result:
+            return "not_cached"
+        path = self.result_path(stage.name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with open(path, "wb") as file:
+                pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            os.remove(path)
+            return "not_cached"
+        return "pickle"
+
+    def load_result(self, stage_name):
+        with open(self.result_path(stage_name), "rb") as file:
+            return pickle.load(file)
+
+    def run_stage(self, stage, results):
+        kwargs = dict(stage.params)
+        kwargs.update({argument: results[upstream] for argument, upstream in stage.inputs.items()})
+        logger.info(f"[{self.name}] Ejecutando etapa: {stage.name}")
+        return stage.func(**kwargs)
+
+    def run(self, force=False):
+        """
+        Ejecuta el pipeline y devuelve los resultados de las etapas ejecutadas
+        o cargadas. Si una etapa falla, las etapas en curso terminan, el estado
+        se guarda y se relanza la excepción.
+        """
+        state = self.load_state()
+        fingerprints, to_run = self.plan(state, force=force)
+        results = {}
+
+        needed = {
+            upstream
+            for name in to_run
+            for upstream in self.stages[name].inputs.values()
+            if upstream not in to_run
+        }
+        for name in self.topological_order():
+            if name in to_run:
+                continue
+            logger.info(f"[{self.name}] Etapa sin cambios, se omite: {name}")
+            if name in needed:
+                # Los resultados None no se guardan en disco ("none" en el estado).
+                stored = state.get(name, {}).get("result")
+                results[name] = None if stored == "none" else self.load_result(name)
+
+        pending = [name for name in self.topological_order() if name in to_run]
+        done = set(self.stages) - to_run
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                if error is None:
+                    for name in list(pending):
+                        if all(dependency in done for dependency in self.stages[name].dependencies):
+                            pending.remove(name)
+                            running[executor.submit(self.run_stage, self.stages[name], results)] = name
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"[{self.name}] Falló la etapa {name}: {e}")
+                        state[name] = {"status": "error", "fingerprint": fingerprints[name], "error": str(e)}
+                        error = error or e
+                        continue
+
+                    results[name] = result
+                    done.add(name)
+                    state[name] = {
+                        "status": "ok",
+                        "fingerprint": fingerprints[name],
+                        "result": self.store_result(self.stages[name], result),
+                        "finished_at": datetime.now().isoformat(timespec="seconds"),
+                    }
+                self.save_state(state)
+
+        if error is not None:
+            raise error
+        logger.info(f"[{self.name}] Pipeline completado: {len(to_run)} etapas ejecutadas, "
+                    f"{len(self.stages) - len(to_run)} omitidas.")
+        return results
@@ -0,0 +1,196 @@
+import os
+import logging
+import operator
+import itertools
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from common.instrumentation import instrument_stage
+
+
+logger = logging.getLogger()
+
+SILVER_DIR = "silver"
+SILVER_COMPRESSION = "zstd"
+SILVER_ROW_GROUP_SIZE = 64 * 1024
+FILTER_OPERATORS = {
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def silver_path(base_dir, name):
+    """
+    Ruta del dataset `name` dentro de la capa silver (`<base_dir>/silver/<name>`).
+    """
+    return os.path.join(base_dir, SILVER_DIR, name)
+
+
+def to_silver_table(data, partition_cols, sort_by=()):
+    """
+    Convierte un DataFrame o tabla Arrow al formato de escritura: columnas
+    categóricas decodificadas (Parquet vuelve a codificarlas por diccionario y
+    así tienen estadísticas min/max), columnas de partición como texto y filas
+    ordenadas por partición y `sort_by`, para que las estadísticas de cada row
+    group sean selectivas.
+    """
+    if isinstance(data, pd.DataFrame):
+        table = pa.Table.from_pandas(data, preserve_index=False)
+    elif isinstance(data, pa.RecordBatch):
+        table = pa.Table.from_batches([data])
+    else:
+        table = data
+    for index, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(index, field.name, table.column(index).cast(field.type.value_type))
+    for column in partition_cols:
+        index = table.schema.get_field_index(column)
+        if not pa.types.is_string(table.schema.field(index).type):
+            table = table.set_column(index, column, table.column(column).cast(pa.string()))
+    keys = list(partition_cols) + [column for column in sort_by if column not in partition_cols]
+    return table.sort_by([(column, "ascending") for column in keys]) if keys and table.num_rows else table
+
+
+@instrument_stage()
+def write_silver(data, dataset_dir, partition_cols, sort_by=(), schema=None, compression=SILVER_COMPRESSION,
+                 row_group_size=SILVER_ROW_GROUP_SIZE, existing_data_behavior="delete_matching"):
+    """
+    Escribe un dataset Parquet particionado estilo Hive (`col=valor/`),
+    comprimido y con estadísticas por row group.
+
+    `data` es un DataFrame, una tabla Arrow o un iterable de bloques (DataFrame
+    o `RecordBatch`), que se escriben uno a uno sin cargar todo en memoria; en
+    ese caso el orden por `sort_by` se aplica dentro de cada bloque y `schema`
+    fija el esquema de los bloques (por defecto, el del primero). Por defecto
+    cada partición escrita reemplaza a la existente.
+    Devuelve un resumen con filas, archivos y particiones escritas.
+    """
+    if isinstance(data, (pd.DataFrame, pa.Table)):
+        chunks = [data]
+    else:
+        chunks = iter(data)
+    tables = (to_silver_table(chunk, partition_cols, sort_by) for chunk in chunks)
+
+    first = next(tables, None)
+    if first is None:
+        logger.warning(f"Sin filas para escribir en el dataset silver: {dataset_dir}")
+        return {"rows": 0, "files": 0, "partitions": 0}
+    schema = schema or first.schema
+    for column in partition_cols:
+        schema = schema.set(schema.get_field_index(column), pa.field(column, pa.string()))
+
+    summary = {"rows": 0, "files": []}
+
+    def batches():
+        for table in itertools.chain([first], tables):
+            yield from table.cast(schema).to_batches()
+            summary["rows"] += table.num_rows
+
+    file_format = ds.ParquetFileFormat()
+    ds.write_dataset(
+        batches(),
+        dataset_dir,
+        schema=schema,
+        format=file_format,
+        file_options=file_format.make_write_options(compression=compression, write_statistics=True),
+        partitioning=ds.partitioning(pa.schema([schema.field(column) for column in partition_cols]), flavor="hive"),
+        basename_template="part-{i}.parquet",
+        max_rows_per_group=row_group_size,
+        min_rows_per_group=min(row_group_size, 1024),
+        existing_data_behavior=existing_data_behavior,
+        file_visitor=lambda written: summary["files"].append(written.path),
+    )
+    partitions = {os.path.dirname(path) for path in summary["files"]}
+    logger.info(
+        f"Dataset silver escrito en {dataset_dir}: {summary['rows']} filas, "
+        f"{len(summary['files'])} archivos, {len(partitions)} particiones."
+    )
+    return {"rows": summary["rows"], "files": len(summary["files"]), "partitions": len(partitions)}
+
+
+def partition_names(dataset_dir):
+    """
+    Columnas de partición de un dataset, a partir de la primera ruta
+    `col=valor/...` (todas las particiones tienen la misma profundidad).
+    """
+    names, path = [], dataset_dir
+    while True:
+        subdirs = sorted(entry.name for entry in os.scandir(path) if entry.is_dir() and "=" in entry.name)
+        if not subdirs:
+            return names
+        names.append(subdirs[0].split("=", 1)[0])
+        path = os.path.join(path, subdirs[0])
+
+
+def silver_dataset(dataset_dir):
+    """
+    Abre un dataset silver. Las columnas de partición se leen como texto (sin
+    inferir tipos), igual que se escribieron.
+    """
+    partition_schema = pa.schema([(name, pa.string()) for name in partition_names(dataset_dir)])
+    return ds.dataset(dataset_dir, format="parquet", partitioning=ds.partitioning(partition_schema, flavor="hive"))
+
+
+def filters_to_expression(filters):
+    """
+    Convierte filtros `[(columna, operador, valor), ...]` (todos deben
+    cumplirse) en una expresión de `pyarrow.dataset`. Operadores: =, ==, !=,
+    <, <=, >, >=, in y not in.
+    """
+    expression = None
+    for column, op, value in filters or []:
+        field = ds.field(column)
+        if op == "in":
+            condition = field.isin(list(value))
+        elif op == "not in":
+            condition = ~field.isin(list(value))
+        elif op in FILTER_OPERATORS:
+            condition = FILTER_OPERATORS[op](field, value)
+        else:
+            raise ValueError(f"Operador de filtro no soportado: {op}")
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def plan_silver_scan(dataset_dir, filters=None):
+    """
+    Cuántos archivos y row groups leería una consulta: los archivos se
+    descartan por el valor de sus particiones y los row groups por sus
+    estadísticas min/max.
+    """
+    dataset = silver_dataset(dataset_dir)
+    expression = filters_to_expression(filters)
+    all_fragments = list(dataset.get_fragments())
+    fragments = list(dataset.get_fragments(filter=expression)) if expression is not None else all_fragments
+    row_groups = sum(fragment.metadata.num_row_groups for fragment in all_fragments)
+    row_groups_read = sum(
+        len(fragment.split_by_row_group(filter=expression, schema=dataset.schema)) if expression is not None
+        else fragment.metadata.num_row_groups
+        for fragment in fragments
+    )
+    return {
+        "files": len(all_fragments),
+        "files_read": len(fragments),
+        "row_groups": row_groups,
+        "row_groups_read": row_groups_read,
+    }
+
+
+@instrument_stage()
+def read_silver(dataset_dir, columns=None, filters=None, as_pandas=True):
+    """
+    Lee sólo las partes de un dataset silver que necesita la consulta:
+    `filters` descarta particiones completas (p. ej. `("market_date", "=",
+    "2017-12-04")`) y row groups cuyas estadísticas no coinciden, y `columns`
+    limita las columnas leídas. Los valores de las columnas de partición son
+    texto. Devuelve un DataFrame (o una tabla Arrow con `as_pandas=False`).
+    """
+    table = silver_dataset(dataset_dir).to_table(columns=columns, filter=filters_to_expression(filters))
+    return table.to_pandas() if as_pandas else table
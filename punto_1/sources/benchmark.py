@@ -0,0 +1,204 @@
+import os
+import time
+import logging
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from core import (
+    filter_and_process_data,
+    records_to_dataframe,
+    parse_file_columnar,
+    prepare_for_sql,
+    connect_to_db,
+    create_table,
+    insert_data,
+    bulk_load,
+    ensure_natural_key,
+    load_long_format,
+    HOUR_COLUMNS,
+)
+
+logger = logging.getLogger()
+
+
+def replicate_file(source_path, target_path, copies):
+    """
+    Genera un archivo OFEI sintético repitiendo `copies` veces el archivo fuente.
+    """
+    with open(source_path, "rb") as source:
+        content = source.read()
+    with open(target_path, "wb") as target:
+        for _ in range(copies):
+            target.write(content)
+    logger.info(f"Archivo sintético generado con {copies} copias: {target_path}")
+
+
+def time_call(func, *args, **kwargs):
+    """
+    Ejecuta una función y devuelve el tiempo transcurrido y su resultado.
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def benchmark_parsers(file_path, copies):
+    """
+    Compara el motor por registros contra el motor columnar sobre el archivo
+    replicado `copies` veces.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        synthetic_path = os.path.join(tmp_dir, "OFEI_benchmark.txt")
+        replicate_file(file_path, synthetic_path, copies)
+        with open(synthetic_path, "rb") as file:
+            total_lines = sum(1 for _ in file)
+
+        records_time, records_df = time_call(
+            lambda: records_to_dataframe(filter_and_process_data(synthetic_path))
+        )
+        columnar_time, columnar_df = time_call(parse_file_columnar, synthetic_path)
+
+    print(f"Líneas: {total_lines:,} | Registros tipo D: {len(columnar_df):,}")
+    print(f"  records : {records_time:8.2f} s")
+    print(f"  columnar: {columnar_time:8.2f} s")
+    print(f"  speedup : {records_time / columnar_time:8.2f}x")
+    return records_df, columnar_df
+
+
+def synthetic_offers_table(file_path, rows):
+    """
+    Construye una tabla Arrow de `rows` registros repitiendo los registros tipo 'D' del archivo.
+    """
+    df = parse_file_columnar(file_path)
+    indices = np.resize(np.arange(len(df)), rows)
+    return pa.Table.from_pandas(df.iloc[indices].reset_index(drop=True), preserve_index=False)
+
+
+def benchmark_bulk_load(file_path, rows, baseline_max_rows=300000):
+    """
+    Compara `prepare_for_sql` + `insert_data` contra `bulk_load` cargando
+    `rows` registros en bases SQLite temporales. Por encima de
+    `baseline_max_rows` se omite `insert_data`, que materializa todas las tuplas.
+    """
+    table = synthetic_offers_table(file_path, rows)
+    insert_time = None
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if rows <= baseline_max_rows:
+            conn = connect_to_db(os.path.join(tmp_dir, "insert_data.db"))
+            create_table(conn)
+            insert_time, _ = time_call(
+                lambda: insert_data(conn, prepare_for_sql(table.to_pandas())[1])
+            )
+            conn.close()
+
+        conn = connect_to_db(os.path.join(tmp_dir, "bulk_load.db"))
+        create_table(conn)
+        bulk_time, stats = time_call(bulk_load, conn, table)
+        conn.close()
+
+    print(f"Registros: {rows:,}")
+    if insert_time is None:
+        print("  insert_data: omitido")
+    else:
+        print(f"  insert_data: {insert_time:8.2f} s ({rows / insert_time:,.0f} filas/s)")
+    print(f"  bulk_load  : {bulk_time:8.2f} s ({stats['rows_per_second']:,.0f} filas/s)")
+    return stats
+
+
+def synthetic_offers_days(file_path, days, start_date="2017-01-01"):
+    """
+    Construye una tabla Arrow con los registros tipo 'D' del archivo repetidos
+    para `days` días de mercado consecutivos.
+    """
+    df = parse_file_columnar(file_path)
+    dates = pd.date_range(start_date, periods=days, freq="D").strftime("%Y-%m-%d")
+    table = synthetic_offers_table(file_path, len(df) * days)
+    return table.append_column("market_date", pa.array(np.repeat(dates.to_numpy(), len(df))))
+
+
+def layout_queries(plant_name, market_date):
+    """
+    Consultas analíticas equivalentes sobre el formato ancho (`ofertas`) y el
+    formato largo (`ofertas_horarias`).
+    """
+    hours = range(1, len(HOUR_COLUMNS) + 1)
+    return {
+        "max_por_hora": (
+            " UNION ALL ".join(f"SELECT {h} AS hour, MAX(HORA_{h}) FROM ofertas" for h in hours),
+            "SELECT hour, MAX(value) FROM ofertas_horarias GROUP BY hour",
+        ),
+        "horas_en_cero_planta": (
+            " UNION ALL ".join(
+                f"SELECT market_date, {h} AS hour FROM ofertas WHERE name = '{plant_name}' AND HORA_{h} = 0"
+                for h in hours
+            ),
+            f"SELECT market_date, hour FROM ofertas_horarias WHERE name = '{plant_name}' AND value = 0",
+        ),
+        "promedio_agente_hora": (
+            "SELECT agent, " + ", ".join(f"AVG(HORA_{h})" for h in hours) + " FROM ofertas GROUP BY agent",
+            "SELECT agent, hour, AVG(value) FROM ofertas_horarias GROUP BY agent, hour",
+        ),
+        "max_por_hora_un_dia": (
+            "SELECT " + ", ".join(f"MAX(HORA_{h})" for h in hours)
+            + f" FROM ofertas WHERE market_date = '{market_date}'",
+            f"SELECT hour, MAX(value) FROM ofertas_horarias WHERE market_date = '{market_date}' GROUP BY hour",
+        ),
+    }
+
+
+def best_time(conn, query, repeat=3):
+    """
+    Mejor tiempo de `repeat` ejecuciones de una consulta.
+    """
+    return min(time_call(lambda: conn.execute(query).fetchall())[0] for _ in range(repeat))
+
+
+def benchmark_layouts(file_path, days, plant_name="CHIVOR7"):
+    """
+    Carga `days` días sintéticos en ambos formatos y compara consultas típicas.
+    """
+    table = synthetic_offers_days(file_path, days)
+    market_date = table.column("market_date")[len(table) // 2].as_py()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = connect_to_db(os.path.join(tmp_dir, "layouts.db"))
+        create_table(conn)
+        ensure_natural_key(conn)
+        bulk_load(conn, table)
+        long_stats = load_long_format(conn, table)
+
+        print(f"Días: {days:,} | Filas ancho: {len(table):,} | Filas largo: {long_stats['rows']:,}")
+        for name, (wide_query, long_query) in layout_queries(plant_name, market_date).items():
+            wide_time = best_time(conn, wide_query)
+            long_time = best_time(conn, long_query)
+            print(f"  {name:22s} ancho: {wide_time:7.3f} s | largo: {long_time:7.3f} s")
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del procesamiento OFEI.")
+    parser.add_argument("--suite", choices=["parsers", "bulk", "layouts"], nargs="+", default=["parsers"])
+    parser.add_argument("--file", default="../raw_data/OFEI1204.txt")
+    parser.add_argument("--copies", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--baseline-max-rows", type=int, default=300000)
+    parser.add_argument("--days", type=int, nargs="+", default=[100, 365])
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    if "parsers" in args.suite:
+        for copies in args.copies:
+            benchmark_parsers(args.file, copies)
+    if "bulk" in args.suite:
+        for rows in args.rows:
+            benchmark_bulk_load(args.file, rows, args.baseline_max_rows)
+    if "layouts" in args.suite:
+        for days in args.days:
+            benchmark_layouts(args.file, days)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,23 @@
+import io
 import os
+import sys
+import re
+import glob
+import time
+import hashlib
 import logging
-import sqlite3
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.instrumentation import instrument_stage
+from common.database import connect_sqlite
+from common.silver import write_silver
 
 
 log_file_path = "../logs/punto_1.log"
@@ -14,6 +30,31 @@ logging.basicConfig(
 )
 logger = logging.getLogger()
 
+HOUR_COLUMNS = [f"HORA_{i+1}" for i in range(24)]
+DEFAULT_BATCH_SIZE = 5000
+PARSER_ENGINES = ("records", "columnar")
+RECORD_COLUMNS = ["agent", "name", "type"]
+MARKET_DATE_HEADER = "Ofertas Iniciales para:"
+NATURAL_KEY_COLUMNS = ["market_date", "agent", "name", "type"]
+NATURAL_KEY_INDEX = "ux_ofertas_natural_key"
+BULK_CHUNK_SIZE = 50000
+BULK_ROWS_PER_TRANSACTION = 1000000
+LAYOUTS = ("wide", "long", "both")
+LONG_TABLE = "ofertas_horarias"
+LONG_COLUMNS = ["market_date", "agent", "name", "type", "hour", "value"]
+LONG_KEY_INDEX = "ix_ofertas_horarias_key"
+LONG_KEY_COLUMNS = ["market_date", "agent", "name", "type", "hour"]
+LONG_INDEXES = {
+    "ix_ofertas_horarias_name_hour": ["name", "hour", "value"],
+    "ix_ofertas_horarias_hour_value": ["hour", "value"],
+}
+BULK_LOAD_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "OFF",
+    "temp_store": "MEMORY",
+    "cache_size": -262144,
+}
+
 
 def read_file(file_path):
     """
@@ -27,7 +68,39 @@ def read_file(file_path):
         logger.warning(f"Error con utf-8. Intentando leer con latin-1: {file_path}")
         with open(file_path, "r", encoding="latin-1") as file:
             return file.readlines()
-        
+
+
+def iter_lines(file_path, chunk_size=1 << 20):
+    """
+    Generador que entrega las líneas del archivo una a una, leyéndolo una sola
+    vez por bloques de líneas completas. Los bloques se decodifican con utf-8;
+    desde el primer bloque que no es utf-8 válido, ese y los siguientes se
+    decodifican con latin-1.
+    """
+    encoding = "utf-8"
+    remainder = b""
+    logger.info(f"Leyendo archivo en modo streaming: {file_path}")
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            chunk = remainder + chunk
+            end = chunk.rfind(b"\n") + 1
+            block, remainder = chunk[:end], chunk[end:]
+            if not block:
+                continue
+            try:
+                text = block.decode(encoding)
+            except UnicodeDecodeError:
+                logger.warning(f"Error con utf-8. Se leerá con latin-1 desde este bloque: {file_path}")
+                encoding = "latin-1"
+                text = block.decode(encoding)
+            yield from io.StringIO(text, newline=None)
+        if remainder:
+            try:
+                text = remainder.decode(encoding)
+            except UnicodeDecodeError:
+                text = remainder.decode("latin-1")
+            yield from io.StringIO(text, newline=None)
+
 
 def parse_line(line, current_agent):
     """
@@ -42,6 +115,8 @@ def parse_line(line, current_agent):
 
     elif line and current_agent:
         parts = line.split(",")
+        if len(parts) < 2:
+            return current_agent, None
         name = parts[0].strip()
         type_record = parts[1].strip()
 
@@ -59,6 +134,7 @@ def parse_line(line, current_agent):
     return current_agent, None
 
 
+@instrument_stage()
 def filter_and_process_data(file_path):
     """
     Lee el archivo, filtra y procesa los registros tipo 'D'.
@@ -76,24 +152,124 @@ def filter_and_process_data(file_path):
     return data
 
 
-def save_processed_data(data, output_path):
+def iter_records(file_path):
     """
-    Convierte los datos procesados en un DataFrame y los guarda como CSV.
+    Generador que entrega los registros tipo 'D' del archivo a medida que se parsean.
     """
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    current_agent = None
+    for line in iter_lines(file_path):
+        current_agent, record = parse_line(line, current_agent)
+        if record:
+            yield record
 
+
+def iter_record_batches(file_path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Agrupa los registros de `iter_records` en lotes de tamaño `batch_size`.
+    """
+    batch = []
+    for record in iter_records(file_path):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@instrument_stage()
+def records_to_dataframe(data):
+    """
+    Convierte una lista de registros en un DataFrame con una columna por hora.
+    """
     df = pd.DataFrame(data)
 
     values_df = pd.DataFrame(
         df["values"].tolist(), 
-        columns=[f"HORA_{i+1}" for i in range(24)]
+        columns=HOUR_COLUMNS
     )
-    df = pd.concat([df.drop(columns=["values"]), values_df], axis=1)
+    return pd.concat([df.drop(columns=["values"]), values_df], axis=1)
+
+
+@instrument_stage()
+def parse_file_columnar(file_path):
+    """
+    Motor de parseo columnar: reúne las líneas tipo 'D' y las convierte en una
+    sola pasada a una matriz float64 (N x 24), con agente, nombre y tipo como
+    columnas categóricas. No crea diccionarios por registro ni usa `pd.concat`.
+    Si algún valor no es numérico recurre al motor por registros.
+    """
+    agent_codes = {}
+    codes = []
+    d_lines = []
+    current_code = None
+
+    for line in iter_lines(file_path):
+        line = line.strip()
+        if line.startswith("AGENTE:"):
+            agent = line.split(":")[1].strip()
+            current_code = agent_codes.setdefault(agent, len(agent_codes))
+        elif line and current_code is not None:
+            parts = line.split(",", 2)
+            if len(parts) == 3 and parts[1].strip() == "D":
+                d_lines.append(line)
+                codes.append(current_code)
+
+    columns = ["agent", "name", "type"] + HOUR_COLUMNS
+    if not d_lines:
+        logger.info("Total de registros procesados: 0")
+        return pd.DataFrame(columns=columns)
 
+    try:
+        df = pd.read_csv(
+            io.StringIO("\n".join(d_lines)),
+            header=None,
+            names=["name", "type"] + HOUR_COLUMNS,
+            dtype={"name": str, "type": "category", **{col: np.float64 for col in HOUR_COLUMNS}},
+            skipinitialspace=True,
+        )
+    except ValueError as e:
+        logger.error(f"Error en el parseo columnar, se usará el motor por registros: {e}")
+        return records_to_dataframe(filter_and_process_data(file_path))
+
+    df["name"] = df["name"].str.strip().astype("category")
+    df.insert(0, "agent", pd.Categorical.from_codes(
+        np.asarray(codes, dtype=np.int32),
+        categories=list(agent_codes)
+    ))
+    logger.info(f"Total de registros procesados: {len(df)}")
+    return df[columns]
+
+
+@instrument_stage()
+def save_processed_dataframe(df, output_path):
+    """
+    Guarda un DataFrame ya estructurado como archivo Parquet.
+    """
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
     df.to_parquet(output_path, index=False)
     logger.info(f"Datos procesados guardados en: {output_path}")
 
 
+def save_processed_dataframe_async(df, output_path):
+    """
+    Guarda el DataFrame como Parquet en un hilo en segundo plano.
+    Devuelve un `Future`; llamar a `.result()` espera la escritura y propaga errores.
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="parquet-writer")
+    future = executor.submit(save_processed_dataframe, df, output_path)
+    executor.shutdown(wait=False)
+    return future
+
+
+def save_processed_data(data, output_path):
+    """
+    Convierte los datos procesados en un DataFrame y los guarda como CSV.
+    """
+    df = records_to_dataframe(data)
+    save_processed_dataframe(df, output_path)
+
+
 def load_parquet_data(input_path):
     """
     Carga un archivo Parquet y lo devuelve como un DataFrame.
@@ -106,12 +282,28 @@ def load_parquet_data(input_path):
         return None
     
 
-def prepare_for_sql(df):
+@instrument_stage()
+def verify_parquet_data(df, input_path):
+    """
+    Relee el archivo Parquet y comprueba que coincide con los datos cargados.
+    """
+    stored = load_parquet_data(input_path)
+    matches = stored is not None and stored.reset_index(drop=True).equals(df.reset_index(drop=True))
+    if matches:
+        logger.info(f"Verificación del Parquet correcta: {input_path}")
+    else:
+        logger.error(f"El Parquet no coincide con los datos cargados: {input_path}")
+    return matches
+
+
+@instrument_stage()
+def prepare_for_sql(df, columns=None):
     """
     Estructura los datos en un formato adecuado para la base de datos.
     Devuelve una lista de tuplas (o registros).
     """
-    columns = ["agent", "name", "type"] + [f"HORA_{i+1}" for i in range(24)]
+    if columns is None:
+        columns = ["agent", "name", "type"] + [f"HORA_{i+1}" for i in range(24)]
     logger.info(f"Estructurando datos para la base de datos con columnas: {columns}")
     
     records = [tuple(row) for row in df[columns].to_numpy()]
@@ -120,55 +312,703 @@ def prepare_for_sql(df):
 
 def connect_to_db(db_path="database/ofertas.db"):
     """
-    Crea una conexión a la base de datos SQLite.
+    Crea una conexión a la base de datos SQLite con los pragmas compartidos
+    (`common.database.SQLITE_PRAGMAS`).
     """
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    conn = sqlite3.connect(db_path)
+    conn = connect_sqlite(db_path)
     logger.info(f"Conectado a la base de datos: {db_path}")
     return conn
 
 
-def create_table(conn):
+@instrument_stage()
+def create_table(conn, table_name="ofertas", value_columns=None):
     """
-    Crea la tabla `ofertas` en la base de datos.
+    Crea la tabla `ofertas` (o `table_name`) en la base de datos.
+    `value_columns` reemplaza las columnas HORA_1..HORA_24 por defecto.
     """
     cursor = conn.cursor()
 
     columns = ["agent TEXT", "name TEXT", "type TEXT"]
-    columns += [f"HORA_{i+1} REAL" for i in range(24)]
+    if value_columns is None:
+        value_columns = [f"HORA_{i+1} REAL" for i in range(24)]
+    columns += value_columns
+    columns += ["market_date TEXT"]
     columns_str = ", ".join(columns)
 
     create_table_query = f"""
-    CREATE TABLE IF NOT EXISTS ofertas (
+    CREATE TABLE IF NOT EXISTS {table_name} (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         {columns_str}
     );
     """
     cursor.execute(create_table_query)
+
+    existing_columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table_name})")]
+    if "market_date" not in existing_columns:
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN market_date TEXT")
+        logger.info(f"Columna `market_date` agregada a la tabla `{table_name}`.")
+
     conn.commit()
-    logger.info("Tabla `ofertas` creada exitosamente.")
+    logger.info(f"Tabla `{table_name}` creada exitosamente.")
 
 
-def insert_data(conn, records):
+@instrument_stage()
+def insert_data(conn, records, table_name="ofertas", columns=None):
     """
-    Inserta los registros en la tabla `ofertas`.
+    Inserta los registros en la tabla `ofertas` (o `table_name`).
     """
     cursor = conn.cursor()
 
+    if columns is None:
+        columns = RECORD_COLUMNS + HOUR_COLUMNS
     placeholders = ", ".join(["?"] * len(records[0]))
-    insert_query = f"INSERT INTO ofertas ({', '.join(['agent', 'name', 'type'] + [f'HORA_{i+1}' for i in range(24)])}) VALUES ({placeholders})"
+    insert_query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
 
     cursor.executemany(insert_query, records)
     conn.commit()
-    logger.info(f"{len(records)} registros insertados en la tabla `ofertas`.")
+    logger.info(f"{len(records)} registros insertados en la tabla `{table_name}`.")
 
 
-def export_table_to_csv(conn, output_path="processed_data/ofertas_table.csv"):
+@instrument_stage()
+def process_file_streaming(conn, file_path, output_path, batch_size=DEFAULT_BATCH_SIZE):
     """
-    Exporta la tabla `ofertas` a un archivo CSV.
+    Procesa el archivo por lotes: cada lote se agrega al archivo Parquet y se
+    inserta en la tabla `ofertas` sin materializar el archivo completo.
+    Devuelve el total de registros procesados.
     """
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    query = "SELECT * FROM ofertas"
-    df = pd.read_sql_query(query, conn)
-    df.to_csv(output_path, index=False)
-    logger.info(f"Tabla exportada a CSV: {output_path}")
\ No newline at end of file
+    writer = None
+    total = 0
+
+    try:
+        for batch in iter_record_batches(file_path, batch_size):
+            df = records_to_dataframe(batch)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+
+            _, records = prepare_for_sql(df)
+            insert_data(conn, records)
+            total += len(records)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    logger.info(f"Procesamiento por lotes finalizado. Total de registros: {total}")
+    return total
+
+
+def record_type_suffix(type_record):
+    """
+    Normaliza un tipo de registro (p. ej. 'AGCP') para usarlo en nombres de tabla o archivo.
+    """
+    return re.sub(r"\W", "_", type_record.lower())
+
+
+def record_columns(layout):
+    """
+    Columnas de salida según el formato del tipo de registro: 'hourly'
+    (24 valores numéricos) o 'scalar' (un valor de texto, p. ej. CONF o C).
+    """
+    if layout == "hourly":
+        return RECORD_COLUMNS + HOUR_COLUMNS
+    return RECORD_COLUMNS + ["value"]
+
+
+def write_record_batch(rows, layout, writers, output_dir=None, conn=None):
+    """
+    Escribe un lote de registros de un mismo tipo en su archivo Parquet
+    `ofei_<tipo>.parquet` y/o en su tabla `ofertas_<tipo>`.
+    """
+    type_record = rows[0][2]
+    columns = record_columns(layout)
+
+    if output_dir is not None:
+        table = pa.Table.from_pandas(pd.DataFrame(rows, columns=columns), preserve_index=False)
+        if type_record not in writers:
+            path = os.path.join(output_dir, f"ofei_{record_type_suffix(type_record)}.parquet")
+            writers[type_record] = pq.ParquetWriter(path, table.schema)
+        writers[type_record].write_table(table)
+
+    if conn is not None:
+        insert_data(conn, rows, f"ofertas_{record_type_suffix(type_record)}", columns)
+
+
+@instrument_stage()
+def extract_record_types(file_path, output_dir=None, conn=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Lee y separa el archivo una sola vez, enrutando cada tipo de registro
+    (D, AGCP, AGCU, MO, PRU, CONF, C, ...) a su propia salida Parquet y/o tabla SQLite.
+    Devuelve un diccionario con el total de registros por tipo.
+    """
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    layouts = {}
+    buffers = {}
+    writers = {}
+    counts = {}
+    current_agent = None
+
+    try:
+        for line in iter_lines(file_path):
+            line = line.strip()
+            if line.startswith("AGENTE:"):
+                current_agent = line.split(":")[1].strip()
+                continue
+            if not line or not current_agent:
+                continue
+
+            parts = [part.strip() for part in line.split(",")]
+            if len(parts) < 3:
+                continue
+            name, type_record, values = parts[0], parts[1], parts[2:]
+            layout = "hourly" if len(values) == len(HOUR_COLUMNS) else "scalar"
+
+            if type_record not in layouts:
+                layouts[type_record] = layout
+                buffers[type_record] = []
+                if conn is not None:
+                    value_columns = (
+                        None if layout == "hourly" else ["value TEXT"]
+                    )
+                    create_table(conn, f"ofertas_{record_type_suffix(type_record)}", value_columns)
+            elif layouts[type_record] != layout:
+                logger.error(f"Número de valores inconsistente para el tipo {type_record}: {line}")
+                continue
+
+            if layout == "hourly":
+                try:
+                    row = (current_agent, name, type_record, *map(float, values))
+                except ValueError:
+                    logger.error(f"Error al procesar valores en línea: {line}")
+                    continue
+            else:
+                row = (current_agent, name, type_record, ",".join(values))
+
+            buffer = buffers[type_record]
+            buffer.append(row)
+            if len(buffer) >= batch_size:
+                write_record_batch(buffer, layout, writers, output_dir, conn)
+                counts[type_record] = counts.get(type_record, 0) + len(buffer)
+                buffers[type_record] = []
+
+        for type_record, buffer in buffers.items():
+            if buffer:
+                write_record_batch(buffer, layouts[type_record], writers, output_dir, conn)
+                counts[type_record] = counts.get(type_record, 0) + len(buffer)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    logger.info(f"Registros extraídos por tipo: {counts}")
+    return counts
+
+
+def read_market_date(file_path, max_lines=10):
+    """
+    Obtiene la fecha de mercado del encabezado `Ofertas Iniciales para: AAAA-MM-DD`.
+    Devuelve None si el encabezado no aparece en las primeras líneas.
+    """
+    with open(file_path, "r", encoding="latin-1") as file:
+        for _, line in zip(range(max_lines), file):
+            line = line.strip()
+            if line.startswith(MARKET_DATE_HEADER):
+                return line[len(MARKET_DATE_HEADER):].strip()
+    logger.warning(f"No se encontró la fecha de mercado en: {file_path}")
+    return None
+
+
+def list_input_files(input_path):
+    """
+    Devuelve la lista ordenada de archivos OFEI a partir de un directorio o patrón glob.
+    """
+    if os.path.isdir(input_path):
+        input_path = os.path.join(input_path, "OFEI*.txt")
+    return sorted(glob.glob(input_path))
+
+
+def parse_dated_file(file_path, engine="columnar"):
+    """
+    Parsea un archivo OFEI y agrega la columna `market_date` del encabezado.
+    Pensada para ejecutarse en un proceso del pool de `ingest_files`.
+    """
+    if engine == "columnar":
+        df = parse_file_columnar(file_path)
+    else:
+        df = records_to_dataframe(filter_and_process_data(file_path))
+    df["market_date"] = read_market_date(file_path)
+    return df
+
+
+def write_dated_batch(conn, df, dataset_dir, upsert=False):
+    """
+    Agrega los registros de un día a la tabla `ofertas` y, una vez confirmados,
+    a su partición `market_date=<fecha>` del dataset silver (reemplazando la
+    partición si existía). Los registros se insertan o actualizan por llave
+    natural con `upsert=True` o si la tabla ya tiene el índice único de una
+    carga incremental anterior.
+    """
+    columns = RECORD_COLUMNS + HOUR_COLUMNS + ["market_date"]
+    _, records = prepare_for_sql(df, columns)
+    if upsert or has_natural_key(conn):
+        upsert_data(conn, records, columns)
+    else:
+        insert_data(conn, records, columns=columns)
+
+    write_offers_silver(df, dataset_dir)
+
+
+def load_offers(conn, df, bulk=False):
+    """
+    Carga el DataFrame (con `market_date`) en la tabla `ofertas`: con upsert si
+    la tabla ya tiene la llave natural, con `bulk_load` si `bulk=True` o con
+    `insert_data` en otro caso. Devuelve el número de registros cargados.
+    """
+    columns = RECORD_COLUMNS + HOUR_COLUMNS + ["market_date"]
+    if has_natural_key(conn):
+        _, records = prepare_for_sql(df, columns)
+        upsert_data(conn, records, columns)
+        return len(records)
+    if bulk:
+        return bulk_load(conn, df, columns=columns)["rows"]
+    _, records = prepare_for_sql(df, columns)
+    insert_data(conn, records, columns=columns)
+    return len(records)
+
+
+def write_offers_silver(df, dataset_dir, market_date=None):
+    """
+    Escribe los registros en el dataset silver de ofertas, particionado por
+    `market_date` y ordenado por agente y planta dentro de cada partición.
+    """
+    if market_date is not None:
+        df = df.assign(market_date=market_date)
+    return write_silver(df, dataset_dir, ["market_date"], sort_by=["agent", "name"])
+
+
+@instrument_stage()
+def ingest_files(conn, file_paths, dataset_dir, workers=None, engine="columnar", incremental=False):
+    """
+    Parsea varios archivos OFEI en paralelo (un archivo por proceso) y centraliza
+    la escritura en el proceso principal. Devuelve un resumen de la carga.
+    Con `incremental=True` se omiten los archivos ya registrados en el manifiesto
+    y los registros se cargan con upsert por llave natural.
+    """
+    os.makedirs(dataset_dir, exist_ok=True)
+    create_table(conn)
+    summary = {"files": 0, "records": 0, "failed": [], "skipped": 0}
+
+    fingerprints = {}
+    if incremental:
+        create_manifest_table(conn)
+        ensure_natural_key(conn)
+        pending = []
+        for file_path in file_paths:
+            needs_loading, fingerprint = file_needs_loading(conn, file_path)
+            if needs_loading:
+                pending.append(file_path)
+                fingerprints[file_path] = fingerprint
+            else:
+                summary["skipped"] += 1
+        logger.info(f"Archivos pendientes: {len(pending)}, omitidos por manifiesto: {summary['skipped']}")
+        file_paths = pending
+
+    if not file_paths:
+        return summary
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(parse_dated_file, file_path, engine): file_path
+            for file_path in file_paths
+        }
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                df = future.result()
+            except Exception as e:
+                logger.error(f"Error procesando el archivo {file_path}: {e}")
+                summary["failed"].append(file_path)
+                continue
+
+            if df.empty:
+                logger.warning(f"El archivo no contiene registros tipo 'D': {file_path}")
+            else:
+                write_dated_batch(conn, df, dataset_dir, upsert=incremental)
+            if incremental:
+                market_date = df["market_date"].iloc[0] if len(df) else None
+                record_file_loaded(conn, fingerprints[file_path], market_date, len(df))
+            summary["files"] += 1
+            summary["records"] += len(df)
+
+    logger.info(
+        f"Carga masiva finalizada: {summary['files']} archivos, "
+        f"{summary['records']} registros, {len(summary['failed'])} con error."
+    )
+    return summary
+
+
+def create_manifest_table(conn):
+    """
+    Crea la tabla `ofertas_manifest` con la huella de cada archivo cargado.
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS ofertas_manifest (
+        file_path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        sha256 TEXT NOT NULL,
+        market_date TEXT,
+        records INTEGER,
+        loaded_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+    conn.commit()
+    logger.info("Tabla `ofertas_manifest` creada exitosamente.")
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """
+    Calcula el hash SHA-256 del archivo leyéndolo por bloques.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_needs_loading(conn, file_path):
+    """
+    Compara el archivo con su entrada en el manifiesto. Si tamaño y fecha de
+    modificación coinciden no se calcula el hash; si cambiaron, el hash decide.
+    Devuelve (necesita_carga, huella).
+    """
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    fingerprint = {"file_path": file_path, "size": stat.st_size, "mtime": stat.st_mtime, "sha256": None}
+
+    row = conn.execute(
+        "SELECT size, mtime, sha256 FROM ofertas_manifest WHERE file_path = ?",
+        (file_path,)
+    ).fetchone()
+    if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+        return False, fingerprint
+
+    fingerprint["sha256"] = file_sha256(file_path)
+    if row and row[2] == fingerprint["sha256"]:
+        conn.execute(
+            "UPDATE ofertas_manifest SET mtime = ? WHERE file_path = ?",
+            (stat.st_mtime, file_path)
+        )
+        conn.commit()
+        return False, fingerprint
+    return True, fingerprint
+
+
+def record_file_loaded(conn, fingerprint, market_date, records):
+    """
+    Registra (o actualiza) la huella de un archivo cargado en el manifiesto.
+    """
+    conn.execute("""
+    INSERT INTO ofertas_manifest (file_path, size, mtime, sha256, market_date, records)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(file_path) DO UPDATE SET
+        size = excluded.size,
+        mtime = excluded.mtime,
+        sha256 = excluded.sha256,
+        market_date = excluded.market_date,
+        records = excluded.records,
+        loaded_at = CURRENT_TIMESTAMP
+    """, (
+        fingerprint["file_path"], fingerprint["size"], fingerprint["mtime"],
+        fingerprint["sha256"], market_date, records
+    ))
+    conn.commit()
+    logger.info(f"Archivo registrado en el manifiesto: {fingerprint['file_path']}")
+
+
+def has_natural_key(conn, table_name="ofertas"):
+    """
+    Indica si la tabla ya tiene el índice único sobre la llave natural.
+    """
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND name = ?",
+        (table_name, NATURAL_KEY_INDEX)
+    ).fetchone() is not None
+
+
+def ensure_natural_key(conn):
+    """
+    Elimina duplicados previos de `ofertas` (conservando el último) y crea el
+    índice único sobre la llave natural (market_date, agent, name, type).
+    """
+    key = ", ".join(NATURAL_KEY_COLUMNS)
+    cursor = conn.execute(f"""
+    DELETE FROM ofertas
+    WHERE market_date IS NOT NULL
+      AND id NOT IN (SELECT MAX(id) FROM ofertas GROUP BY {key})
+    """)
+    if cursor.rowcount:
+        logger.warning(f"{cursor.rowcount} registros duplicados eliminados de `ofertas`.")
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {NATURAL_KEY_INDEX} ON ofertas ({key})")
+    conn.commit()
+
+
+@instrument_stage()
+def upsert_data(conn, records, columns):
+    """
+    Inserta los registros en `ofertas` o actualiza sus valores si la llave
+    natural (market_date, agent, name, type) ya existe.
+    """
+    placeholders = ", ".join(["?"] * len(columns))
+    updates = ", ".join(
+        f"{col} = excluded.{col}" for col in columns if col not in NATURAL_KEY_COLUMNS
+    )
+    upsert_query = f"""
+    INSERT INTO ofertas ({', '.join(columns)}) VALUES ({placeholders})
+    ON CONFLICT({', '.join(NATURAL_KEY_COLUMNS)}) DO UPDATE SET {updates}
+    """
+    conn.executemany(upsert_query, records)
+    conn.commit()
+    logger.info(f"{len(records)} registros insertados o actualizados en la tabla `ofertas`.")
+
+
+@contextmanager
+def bulk_load_pragmas(conn, pragmas=None):
+    """
+    Aplica pragmas orientados a carga masiva (WAL, synchronous=OFF, ...) y
+    restaura los valores originales al terminar.
+    """
+    pragmas = pragmas or BULK_LOAD_PRAGMAS
+    previous = {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in pragmas}
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    logger.info(f"Pragmas de carga masiva aplicados: {pragmas}")
+    try:
+        yield conn
+    finally:
+        for name, value in previous.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        logger.info(f"Pragmas restaurados: {previous}")
+
+
+def drop_table_indexes(conn, table_name):
+    """
+    Elimina los índices explícitos no únicos de la tabla y devuelve sus
+    sentencias CREATE para recrearlos después de la carga. Los índices únicos
+    (p. ej. la llave natural) se conservan para que la restricción se siga
+    validando durante la carga.
+    """
+    unique = {row[1] for row in conn.execute(f"PRAGMA index_list({table_name})") if row[2]}
+    indexes = [
+        (name, sql) for name, sql in conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (table_name,)
+        ).fetchall()
+        if name not in unique
+    ]
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+    conn.commit()
+    if indexes:
+        logger.info(f"Índices diferidos durante la carga: {[name for name, _ in indexes]}")
+    return [sql for _, sql in indexes]
+
+
+def recreate_indexes(conn, index_statements):
+    """
+    Ejecuta las sentencias CREATE devueltas por `drop_table_indexes`.
+    """
+    for statement in index_statements:
+        conn.execute(statement)
+    conn.commit()
+
+
+def source_column_names(source):
+    """
+    Devuelve los nombres de columna de una fuente columnar sin leer sus datos.
+    """
+    if isinstance(source, pd.DataFrame):
+        return list(source.columns)
+    if isinstance(source, pa.Table):
+        return source.schema.names
+    if os.path.isdir(source):
+        return ds.dataset(source, format="parquet", partitioning="hive").schema.names
+    return pq.read_schema(source).names
+
+
+def column_to_pylist(array):
+    """
+    Convierte una columna Arrow a lista de Python pasando por NumPy, que es
+    bastante más rápido que `to_pylist` para columnas numéricas y de diccionario.
+    """
+    if array.null_count:
+        return array.to_pylist()
+    if pa.types.is_dictionary(array.type):
+        values = np.asarray(array.dictionary.to_pylist(), dtype=object)
+        return values[array.indices.to_numpy()].tolist()
+    return array.to_numpy(zero_copy_only=False).tolist()
+
+
+def iter_source_batches(source, columns=None, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Entrega `pyarrow.RecordBatch` de hasta `chunk_size` filas desde una fuente
+    columnar: ruta a un archivo/dataset Parquet, `pa.Table`, `pd.DataFrame`
+    o un iterable de `RecordBatch` (que se entrega tal cual).
+    """
+    if not isinstance(source, (str, os.PathLike, pd.DataFrame, pa.Table)):
+        yield from source
+        return
+    if isinstance(source, pd.DataFrame):
+        source = pa.Table.from_pandas(source, preserve_index=False)
+    if isinstance(source, pa.Table):
+        if columns is not None:
+            source = source.select(columns)
+        yield from source.to_batches(max_chunksize=chunk_size)
+    elif os.path.isdir(source):
+        dataset = ds.dataset(source, format="parquet", partitioning="hive")
+        yield from dataset.to_batches(columns=columns, batch_size=chunk_size)
+    else:
+        yield from pq.ParquetFile(source).iter_batches(batch_size=chunk_size, columns=columns)
+
+
+@instrument_stage()
+def bulk_load(conn, source, table_name="ofertas", columns=None,
+              chunk_size=BULK_CHUNK_SIZE, rows_per_transaction=BULK_ROWS_PER_TRANSACTION, upsert_keys=None):
+    """
+    Carga masiva en SQLite desde una fuente columnar: las filas se convierten a
+    tuplas por bloques de `chunk_size`, se confirman cada `rows_per_transaction`
+    filas con pragmas de carga y los índices no únicos se recrean al final.
+    Con `upsert_keys` (columnas de un índice único) las filas existentes con la
+    misma llave se actualizan en lugar de duplicarse.
+    Si la carga falla se deshace la transacción en curso (las ya confirmadas
+    se conservan), se recrean los índices y se propaga el error original.
+    Devuelve un resumen con filas cargadas, segundos y filas/s.
+    """
+    if columns is None:
+        existing_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+        columns = [col for col in source_column_names(source) if col in existing_columns]
+
+    insert_query = (
+        f"INSERT INTO {table_name} ({', '.join(columns)}) "
+        f"VALUES ({', '.join(['?'] * len(columns))})"
+    )
+    if upsert_keys:
+        updates = ", ".join(f"{col} = excluded.{col}" for col in columns if col not in upsert_keys)
+        insert_query += f" ON CONFLICT({', '.join(upsert_keys)}) DO UPDATE SET {updates}"
+    total = 0
+    pending = 0
+    start = time.perf_counter()
+
+    with bulk_load_pragmas(conn):
+        index_statements = drop_table_indexes(conn, table_name)
+        try:
+            for batch in iter_source_batches(source, columns, chunk_size):
+                rows = zip(*(column_to_pylist(batch.column(i)) for i in range(batch.num_columns)))
+                conn.executemany(insert_query, rows)
+                total += batch.num_rows
+                pending += batch.num_rows
+                if pending >= rows_per_transaction:
+                    conn.commit()
+                    pending = 0
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            try:
+                recreate_indexes(conn, index_statements)
+            except Exception as e:
+                logger.error(f"No se pudieron recrear los índices tras el error de carga: {e}")
+            raise
+        recreate_indexes(conn, index_statements)
+
+    elapsed = time.perf_counter() - start
+    rows_per_second = total / elapsed if elapsed else float("inf")
+    logger.info(
+        f"Carga masiva en `{table_name}`: {total} filas en {elapsed:.2f} s "
+        f"({rows_per_second:,.0f} filas/s)."
+    )
+    return {"rows": total, "seconds": elapsed, "rows_per_second": rows_per_second}
+
+
+def wide_to_long(df):
+    """
+    Convierte registros con columnas HORA_1..HORA_24 al formato largo
+    (market_date, agent, name, type, hour, value), una fila por hora.
+    Todos los registros deben tener `market_date`: es la primera columna de la
+    llave de `ofertas_horarias` y separa las cargas de días distintos.
+    """
+    if "market_date" not in df:
+        raise ValueError("El formato largo requiere la columna `market_date`.")
+    if df["market_date"].isna().any():
+        raise ValueError("El formato largo no admite registros sin `market_date`.")
+    hours = len(HOUR_COLUMNS)
+    return pd.DataFrame({
+        "market_date": np.repeat(df["market_date"].to_numpy(), hours),
+        "agent": np.repeat(df["agent"].to_numpy(), hours),
+        "name": np.repeat(df["name"].to_numpy(), hours),
+        "type": np.repeat(df["type"].to_numpy(), hours),
+        "hour": np.tile(np.arange(1, hours + 1, dtype=np.int64), len(df)),
+        "value": df[HOUR_COLUMNS].to_numpy(dtype=np.float64).ravel(),
+    })
+
+
+def iter_long_batches(source, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Entrega la fuente columnar en formato largo, un `RecordBatch` por bloque.
+    """
+    for batch in iter_source_batches(source, chunk_size=chunk_size):
+        yield pa.RecordBatch.from_pandas(wide_to_long(batch.to_pandas()), preserve_index=False)
+
+
+def create_long_table(conn):
+    """
+    Crea la tabla normalizada `ofertas_horarias`, su índice único sobre la
+    llave (market_date, agent, name, type, hour) y los índices compuestos.
+    Si la tabla venía de una versión con índice de llave no único, elimina
+    los duplicados (conservando el último) antes de volverlo único.
+    """
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {LONG_TABLE} (
+        market_date TEXT,
+        agent TEXT NOT NULL,
+        name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        hour INTEGER NOT NULL CHECK(hour BETWEEN 1 AND 24),
+        value REAL
+    );
+    """)
+    key = ", ".join(LONG_KEY_COLUMNS)
+    unique = {row[1]: row[2] for row in conn.execute(f"PRAGMA index_list({LONG_TABLE})")}
+    if unique.get(LONG_KEY_INDEX) == 0:
+        cursor = conn.execute(f"""
+        DELETE FROM {LONG_TABLE}
+        WHERE rowid NOT IN (SELECT MAX(rowid) FROM {LONG_TABLE} GROUP BY {key})
+        """)
+        if cursor.rowcount:
+            logger.warning(f"{cursor.rowcount} filas duplicadas eliminadas de `{LONG_TABLE}`.")
+        conn.execute(f"DROP INDEX {LONG_KEY_INDEX}")
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {LONG_KEY_INDEX} ON {LONG_TABLE} ({key})")
+    for index_name, index_columns in LONG_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {LONG_TABLE} ({', '.join(index_columns)})")
+    conn.commit()
+    logger.info(f"Tabla `{LONG_TABLE}` creada exitosamente.")
+
+
+@instrument_stage()
+def load_long_format(conn, source, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Carga la fuente columnar (formato ancho) en `ofertas_horarias` usando
+    `bulk_load`, transformando cada bloque al formato largo. Volver a cargar
+    un día actualiza sus filas (upsert por llave) en lugar de duplicarlas.
+    """
+    create_long_table(conn)
+    return bulk_load(
+        conn,
+        iter_long_batches(source, chunk_size),
+        table_name=LONG_TABLE,
+        columns=LONG_COLUMNS,
+        chunk_size=chunk_size,
+        upsert_keys=LONG_KEY_COLUMNS
+    )
@@ -0,0 +1,120 @@
+import os
+import csv
+import time
+import logging
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from core import (
+    load_ddec_data,
+    read_ddec_data,
+    remove_accents,
+    remove_accents_series,
+    strip_accents,
+    DDEC_HOUR_COLUMNS,
+)
+
+logger = logging.getLogger()
+
+
+def time_call(func, *args, **kwargs):
+    """
+    Ejecuta una función y devuelve el tiempo transcurrido y su resultado.
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def write_synthetic_ddec(source_path, target_path, rows, seed=0):
+    """
+    Genera un archivo dDEC sintético de `rows` filas con las centrales del
+    archivo fuente y valores horarios aleatorios.
+    """
+    centrals = pd.read_csv(source_path, header=None, usecols=[0], encoding="latin1")[0].to_numpy()
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame(
+        rng.integers(0, 10000, size=(rows, len(DDEC_HOUR_COLUMNS)), dtype=np.int32),
+        columns=DDEC_HOUR_COLUMNS
+    )
+    # Sólo la central va entre comillas, como en los archivos dDEC originales.
+    data.insert(0, "central", '"' + pd.Series(np.resize(centrals, rows)) + '"')
+    data.to_csv(target_path, header=False, index=False, quoting=csv.QUOTE_NONE, encoding="latin1")
+
+
+def benchmark_readers(source_path, rows):
+    """
+    Compara `load_ddec_data` contra `read_ddec_data` con ambos motores.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        synthetic_path = os.path.join(tmp_dir, "dDEC_benchmark.txt")
+        write_synthetic_ddec(source_path, synthetic_path, rows)
+
+        readers = {
+            "load_ddec_data": lambda: load_ddec_data(synthetic_path),
+            "fixed / c": lambda: read_ddec_data(synthetic_path, engine="c"),
+            "fixed / pyarrow": lambda: read_ddec_data(synthetic_path, engine="pyarrow"),
+        }
+        results = {name: time_call(reader) for name, reader in readers.items()}
+
+    baseline_time = results["load_ddec_data"][0]
+    print(f"Filas: {rows:,}")
+    for name, (elapsed, df) in results.items():
+        memory_mb = df.memory_usage(deep=True).sum() / (1024 * 1024)
+        print(f"  {name:16s}: {elapsed:8.3f} s | {memory_mb:8.1f} MB | speedup {baseline_time / elapsed:5.2f}x")
+
+
+def synthetic_agent_names(rows, distinct, seed=0):
+    """
+    Columna de `rows` nombres con tildes repetidos, tomados de `distinct` valores.
+    """
+    names = np.array([f"COMPAÑÍA ENERGÉTICA Nº {i}" for i in range(distinct)], dtype=object)
+    rng = np.random.default_rng(seed)
+    return pd.Series(names[rng.integers(0, distinct, size=rows)])
+
+
+def benchmark_accents(rows, distinct):
+    """
+    Compara `Series.map(remove_accents)` sin caché y con caché contra
+    `remove_accents_series` en una columna de nombres repetidos.
+    """
+    values = synthetic_agent_names(rows, distinct)
+    uncached = strip_accents.__wrapped__
+
+    strip_accents.cache_clear()
+    methods = {
+        "map sin caché": lambda: values.map(lambda value: uncached(value) if isinstance(value, str) else value),
+        "map con caché": lambda: values.map(remove_accents),
+        "remove_accents_series": lambda: remove_accents_series(values),
+    }
+    results = {name: time_call(method) for name, method in methods.items()}
+
+    expected = results["map sin caché"][1]
+    baseline_time = results["map sin caché"][0]
+    print(f"Filas: {rows:,} | Valores distintos: {distinct:,}")
+    for name, (elapsed, result) in results.items():
+        assert result.tolist() == expected.tolist(), name
+        print(f"  {name:22s}: {elapsed:8.3f} s | speedup {baseline_time / elapsed:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de lectura dDEC y normalización de tildes.")
+    parser.add_argument("--suite", choices=["readers", "accents"], nargs="+", default=["readers"])
+    parser.add_argument("--file", default="../raw_data/dDEC1204.txt")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--distinct", type=int, nargs="+", default=[5, 1000])
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    if "readers" in args.suite:
+        for rows in args.rows:
+            benchmark_readers(args.file, rows)
+    if "accents" in args.suite:
+        for rows in args.rows:
+            for distinct in args.distinct:
+                benchmark_accents(rows, distinct)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,21 @@
+import os
+import re
+import glob
+import sys
+import json
+import shutil
+import time
+import hashlib
+import functools
+import numpy as np
 import pandas as pd
 import logging
 import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.instrumentation import instrument_stage
+from common.silver import write_silver
 
 
 logger = logging.getLogger()
@@ -22,32 +37,152 @@ RENAME_MAP: str = {
 }
 
 
+DDEC_FILE_PATTERN = re.compile(r'ddec(\d{2})(\d{2})', re.IGNORECASE)
+DEFAULT_MARKET_YEAR = 2017
+DDEC_HOUR_COLUMNS = [f"hora_{i}" for i in range(1, 25)]
+DDEC_COLUMNS = ["central"] + DDEC_HOUR_COLUMNS
+DDEC_ENGINES = ("c", "pyarrow")
+MASTER_CACHE_VERSION = 1
+MASTER_SNAPSHOT_FILE = "master_data.parquet"
+MASTER_METADATA_FILE = "master_data.json"
+ACCENT_CACHE_SIZE = 65536
+# Directorio de los reportes por agente (bajo processed_data) según el formato.
+AGENT_OUTPUT_FORMATS = {"csv": "agents_csv", "parquet": "agents"}
+
+
+@functools.lru_cache(maxsize=ACCENT_CACHE_SIZE)
+def strip_accents(text: str):
+    return ''.join(
+        c for c in unicodedata.normalize('NFD', text)
+        if unicodedata.category(c) != 'Mn'
+    )
+
+
 def remove_accents(text):
     if isinstance(text, str):
-        return ''.join(
-            c for c in unicodedata.normalize('NFD', text)
-            if unicodedata.category(c) != 'Mn'
-        )
+        return strip_accents(text)
     return text
 
 
+def remove_accents_series(values: pd.Series):
+    """
+    Quita las tildes de una columna normalizando sólo sus valores distintos:
+    los valores se codifican como categoría, se normalizan las categorías y
+    se reconstruye la columna con los códigos. El resultado es categórico.
+    """
+    categorical = values.astype('category')
+    categories = categorical.cat.categories
+    if len(categories) == 0:
+        # Columna vacía o sólo con nulos: no hay nada que normalizar.
+        return categorical
+    normalized = pd.Index([remove_accents(value) for value in categories])
+    # Dos valores distintos pueden quedar iguales sin tildes (p. ej. "Á" y "A").
+    new_categories = normalized.unique()
+    mapping = new_categories.get_indexer(normalized)
+    codes = categorical.cat.codes.to_numpy()
+    new_codes = np.where(codes >= 0, mapping[codes], -1)
+    return pd.Series(
+        pd.Categorical.from_codes(new_codes, categories=new_categories),
+        index=values.index,
+        name=values.name
+    )
+
+
+@instrument_stage()
 def load_master_data(file_path: str):
     try:
         logger.info("Cargando datos maestros desde el archivo Excel.")
         master_data = pd.read_excel(file_path)
-        master_data.columns = (
+        columns = (
             master_data.columns.str.strip()
             .str.lower()
             .str.replace(' ', '_')
             .str.replace(r'[^\w]', '', regex=True)
-            .map(remove_accents)
         )
+        master_data.columns = remove_accents_series(pd.Series(columns)).astype(str)
         return master_data.rename(columns=RENAME_MAP)
     except Exception as e:
         logger.error(f"Error cargando el archivo maestro: {e}")
         raise
 
 
+def file_sha256(file_path: str, chunk_size: int = 1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_master_cache_metadata(cache_dir: str):
+    metadata_path = os.path.join(cache_dir, MASTER_METADATA_FILE)
+    snapshot_path = os.path.join(cache_dir, MASTER_SNAPSHOT_FILE)
+    if not (os.path.exists(metadata_path) and os.path.exists(snapshot_path)):
+        return None
+    with open(metadata_path, "r", encoding="utf-8") as file:
+        metadata = json.load(file)
+    if metadata.get("version") != MASTER_CACHE_VERSION:
+        return None
+    return metadata
+
+
+def write_master_cache_metadata(cache_dir: str, metadata: dict):
+    metadata_path = os.path.join(cache_dir, MASTER_METADATA_FILE)
+    with open(metadata_path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(metadata, file, indent=2)
+    os.replace(metadata_path + ".tmp", metadata_path)
+
+
+def write_master_cache(master_data: pd.DataFrame, cache_dir: str, metadata: dict):
+    os.makedirs(cache_dir, exist_ok=True)
+    snapshot_path = os.path.join(cache_dir, MASTER_SNAPSHOT_FILE)
+    master_data.to_parquet(snapshot_path + ".tmp", index=False)
+    os.replace(snapshot_path + ".tmp", snapshot_path)
+    write_master_cache_metadata(cache_dir, metadata)
+
+
+@instrument_stage()
+def load_master_data_cached(file_path: str, cache_dir: str):
+    """
+    Carga los datos maestros desde un snapshot Parquet ya normalizado. El
+    snapshot se invalida cuando cambia el Excel: si tamaño y fecha de
+    modificación coinciden se usa directamente; si no, decide el SHA-256.
+    """
+    try:
+        stat = os.stat(file_path)
+        metadata = read_master_cache_metadata(cache_dir)
+        snapshot_path = os.path.join(cache_dir, MASTER_SNAPSHOT_FILE)
+
+        if metadata is not None:
+            if metadata["size"] == stat.st_size and metadata["mtime"] == stat.st_mtime:
+                logger.info(f"Datos maestros cargados desde caché: {snapshot_path}")
+                return pd.read_parquet(snapshot_path)
+
+            sha256 = file_sha256(file_path)
+            if metadata["sha256"] == sha256:
+                metadata["mtime"] = stat.st_mtime
+                write_master_cache_metadata(cache_dir, metadata)
+                logger.info(f"Datos maestros sin cambios (hash), se usa la caché: {snapshot_path}")
+                return pd.read_parquet(snapshot_path)
+        else:
+            sha256 = file_sha256(file_path)
+
+        logger.info("Caché de datos maestros inexistente o desactualizada, se regenera.")
+        master_data = load_master_data(file_path)
+        write_master_cache(master_data, cache_dir, {
+            "version": MASTER_CACHE_VERSION,
+            "source": os.path.abspath(file_path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": sha256,
+        })
+        return master_data
+    except Exception as e:
+        logger.error(f"Error cargando la caché de datos maestros: {e}")
+        raise
+
+
+@instrument_stage()
 def filter_master_data(master_data: pd.DataFrame):
     try:
         logger.info("Filtrando datos maestros para agentes específicos y tipos de central.")
@@ -64,6 +199,117 @@ def filter_master_data(master_data: pd.DataFrame):
         raise
 
 
+class MasterDataIndex:
+    """
+    Índice de los datos maestros construido una sola vez: central -> filas,
+    agente (sin tildes) -> filas y tipo de central -> filas (tablas hash de
+    `groupby` sobre las llaves codificadas como categorías).
+    Permite filtrar por cualquier combinación de agente y tipo de central y
+    hacer un hash join contra los datos dDEC sin volver a recorrer ni
+    fusionar los datos maestros completos.
+    """
+
+    AGENT_COLUMN = 'nombre_visible_agente'
+    TYPE_COLUMN = 'tipo_de_central_hidro_termo_filo_menor'
+    CENTRAL_COLUMN = 'central'
+
+    def __init__(self, master_data: pd.DataFrame):
+        data = master_data.copy()
+        data[self.AGENT_COLUMN] = data[self.AGENT_COLUMN].fillna('DESCONOCIDO')
+        data[self.TYPE_COLUMN] = data[self.TYPE_COLUMN].fillna('')
+        self.data = data
+
+        # Las columnas de `data` conservan su tipo; sólo las llaves del índice
+        # se codifican, para que el join compare códigos enteros.
+        self.central_keys = pd.Categorical(data[self.CENTRAL_COLUMN])
+        self.by_central = self.group_positions(self.central_keys)
+        # Agentes sin tildes: "ALEJANDRIA" también encuentra "ALEJANDRÍA".
+        self.by_agent = self.group_positions(remove_accents_series(data[self.AGENT_COLUMN]))
+        self.by_type = self.group_positions(pd.Categorical(data[self.TYPE_COLUMN]))
+
+        self.ddec_data = None
+        self.ddec_rows = None
+        self.ddec_unique = False
+
+    def group_positions(self, keys):
+        return self.data.groupby(keys, observed=True, sort=False).indices
+
+    def agents_matching(self, agent: str):
+        agent = remove_accents(agent)
+        return [name for name in self.by_agent if agent in name]
+
+    def positions(self, agent: str = None, plant_types=None):
+        """
+        Posiciones (en orden original) de las filas cuyo agente contiene
+        `agent` y cuyo tipo de central está en `plant_types`. None = sin filtro.
+        """
+        selected = np.arange(len(self.data))
+        if agent is not None:
+            groups = [self.by_agent[name] for name in self.agents_matching(agent)]
+            agent_positions = np.concatenate(groups) if groups else np.array([], dtype=np.intp)
+            selected = np.intersect1d(selected, agent_positions)
+        if plant_types is not None:
+            groups = [self.by_type[plant_type] for plant_type in plant_types if plant_type in self.by_type]
+            type_positions = np.concatenate(groups) if groups else np.array([], dtype=np.intp)
+            selected = np.intersect1d(selected, type_positions)
+        return selected
+
+    def select(self, agent: str = None, plant_types=None):
+        return self.data.iloc[self.positions(agent, plant_types)]
+
+    def attach_ddec(self, ddec_data: pd.DataFrame):
+        """
+        Registra los datos dDEC del día y, para cada categoría de central de
+        los datos maestros, la fila dDEC que le corresponde (-1 si no está),
+        para reutilizarla en varios `join`. Sólo se comparan los valores
+        distintos de ambas columnas; el resto son operaciones sobre códigos.
+        """
+        self.ddec_data = ddec_data
+        ddec_keys = pd.Categorical(ddec_data[self.CENTRAL_COLUMN])
+        codes = ddec_keys.codes
+        valid = codes >= 0
+        self.ddec_unique = np.bincount(codes[valid], minlength=len(ddec_keys.categories)).max(initial=0) <= 1
+
+        row_by_code = np.full(len(ddec_keys.categories), -1, dtype=np.intp)
+        row_by_code[codes[valid]] = np.flatnonzero(valid)
+        category_map = ddec_keys.categories.get_indexer(self.central_keys.categories)
+        self.ddec_rows = np.where(category_map >= 0, row_by_code[category_map], -1)
+
+    @instrument_stage("master_index_join")
+    def join(self, ddec_data: pd.DataFrame = None, agent: str = None, plant_types=None):
+        """
+        Equivalente a `merge_datasets(filter(...), ddec_data)` usando los
+        códigos de central registrados con `attach_ddec`. Si `ddec_data` es
+        None usa el registrado previamente.
+        """
+        if ddec_data is not None and ddec_data is not self.ddec_data:
+            self.attach_ddec(ddec_data)
+        if self.ddec_data is None:
+            raise ValueError("No hay datos dDEC registrados en el índice.")
+
+        selected = self.positions(agent, plant_types)
+        if not self.ddec_unique:
+            return pd.merge(self.data.iloc[selected], self.ddec_data, on=self.CENTRAL_COLUMN, how='inner')
+
+        codes = self.central_keys.codes[selected]
+        right = np.where(codes >= 0, self.ddec_rows[codes], -1)
+        matched = right >= 0
+        left_rows = self.data.iloc[selected[matched]].reset_index(drop=True)
+        right_rows = self.ddec_data.iloc[right[matched]].drop(columns=self.CENTRAL_COLUMN).reset_index(drop=True)
+        return pd.concat([left_rows, right_rows], axis=1)
+
+
+@instrument_stage()
+def build_master_index(master_data: pd.DataFrame):
+    try:
+        logger.info("Construyendo índice de datos maestros.")
+        return MasterDataIndex(master_data)
+    except KeyError as e:
+        logger.error(f"Error en las columnas del archivo maestro: {e}")
+        raise
+
+
+@instrument_stage()
 def load_ddec_data(file_path: str):
     try:
         logging.info("Cargando datos del archivo dDEC1204.TXT.")
@@ -80,6 +326,68 @@ def load_ddec_data(file_path: str):
         raise
 
 
+def compact_hours(ddec_data: pd.DataFrame):
+    """
+    Reduce las columnas de horas a int16 cuando todos los valores caben en ese tipo.
+    """
+    hours = ddec_data[DDEC_HOUR_COLUMNS]
+    info = np.iinfo(np.int16)
+    if len(hours) and hours.min().min() >= info.min and hours.max().max() <= info.max:
+        ddec_data[DDEC_HOUR_COLUMNS] = hours.astype(np.int16)
+    return ddec_data
+
+
+def read_ddec_pyarrow(file_path: str, memory_map: bool = True):
+    import pyarrow as pa
+    from pyarrow import csv
+
+    read_options = csv.ReadOptions(column_names=DDEC_COLUMNS, encoding="latin1")
+    convert_options = csv.ConvertOptions(
+        column_types={
+            "central": pa.dictionary(pa.int32(), pa.string()),
+            **{column: pa.int32() for column in DDEC_HOUR_COLUMNS}
+        }
+    )
+    source = pa.memory_map(file_path) if memory_map else file_path
+    try:
+        table = csv.read_csv(source, read_options=read_options, convert_options=convert_options)
+    finally:
+        if memory_map:
+            source.close()
+    return table.to_pandas()
+
+
+@instrument_stage()
+def read_ddec_data(file_path: str, engine: str = "c", memory_map: bool = True, compact: bool = True):
+    """
+    Lector de archivos dDEC con el esquema declarado de antemano: `central`
+    categórica y las 24 horas como int32 (int16 con `compact` si los valores
+    caben). `engine` puede ser "c" (pandas) o "pyarrow"; `memory_map` lee el
+    archivo mapeado en memoria.
+    """
+    if engine not in DDEC_ENGINES:
+        raise ValueError(f"Motor de lectura dDEC no soportado: {engine}")
+    try:
+        logging.info(f"Cargando datos del archivo dDEC {os.path.basename(file_path)} (motor {engine}).")
+        if engine == "pyarrow":
+            ddec_data = read_ddec_pyarrow(file_path, memory_map=memory_map)
+        else:
+            ddec_data = pd.read_csv(
+                file_path,
+                delimiter=',',
+                header=None,
+                names=DDEC_COLUMNS,
+                dtype={"central": "category", **{column: np.int32 for column in DDEC_HOUR_COLUMNS}},
+                encoding="latin1",
+                memory_map=memory_map
+            )
+        return compact_hours(ddec_data) if compact else ddec_data
+    except Exception as e:
+        logging.error(f"Error cargando el archivo dDEC: {e}")
+        raise
+
+
+@instrument_stage()
 def merge_datasets(master_data: pd.DataFrame, ddec_data: pd.DataFrame):
     try:
         logging.info("Realizando merge entre datos maestros y dDEC.")
@@ -89,6 +397,7 @@ def merge_datasets(master_data: pd.DataFrame, ddec_data: pd.DataFrame):
         raise
 
 
+@instrument_stage()
 def calculate_horizontal_sum(data: pd.DataFrame):
     try:
         logging.info("Calculando suma horizontal de las columnas de horas.")
@@ -100,6 +409,7 @@ def calculate_horizontal_sum(data: pd.DataFrame):
         raise
 
 
+@instrument_stage()
 def save_results(data: pd.DataFrame, output_file: str):
     try:
         logging.info(f"Guardando resultados filtrados en {output_file}.")
@@ -107,3 +417,184 @@ def save_results(data: pd.DataFrame, output_file: str):
     except Exception as e:
         logging.error(f"Error guardando los resultados: {e}")
         raise
+
+
+def save_results_silver(data: pd.DataFrame, dataset_dir: str, market_date: str = None):
+    """
+    Guarda los resultados en el dataset silver particionado por `market_date`
+    y agente, ordenados por tipo de central y central dentro de cada partición.
+    """
+    try:
+        if market_date is not None:
+            data = data.assign(market_date=market_date)
+        return write_silver(
+            data,
+            dataset_dir,
+            ['market_date', MasterDataIndex.AGENT_COLUMN],
+            sort_by=[MasterDataIndex.TYPE_COLUMN, MasterDataIndex.CENTRAL_COLUMN]
+        )
+    except Exception as e:
+        logging.error(f"Error guardando los resultados en el dataset silver: {e}")
+        raise
+
+
+def agent_slug(agent: str):
+    return re.sub(r'[^0-9A-Za-z]+', '_', remove_accents(agent)).strip('_').lower() or 'desconocido'
+
+
+@instrument_stage()
+def calculate_all_agents(master_index: MasterDataIndex, ddec_data: pd.DataFrame, plant_types=None):
+    """
+    Calcula la suma horizontal para todos los agentes en una sola pasada:
+    un único join contra dDEC y una única suma vectorizada sobre todas las filas.
+    """
+    try:
+        logging.info("Calculando suma horizontal para todos los agentes.")
+        merged_data = master_index.join(ddec_data=ddec_data, plant_types=plant_types)
+        return calculate_horizontal_sum(merged_data)
+    except Exception as e:
+        logging.error(f"Error calculando los reportes por agente: {e}")
+        raise
+
+
+@instrument_stage()
+def summarize_by_agent(data: pd.DataFrame):
+    try:
+        logging.info("Resumiendo resultados por agente y tipo de central.")
+        return (
+            data.groupby(
+                [MasterDataIndex.AGENT_COLUMN, MasterDataIndex.TYPE_COLUMN], sort=True
+            )['suma_horizontal']
+            .agg(centrales='count', suma_horizontal='sum')
+            .reset_index()
+        )
+    except Exception as e:
+        logging.error(f"Error resumiendo por agente: {e}")
+        raise
+
+
+def clear_agent_outputs(output_dir: str, output_format: str):
+    """
+    Elimina los reportes por agente de una ejecución anterior en `output_dir`
+    (los `*.csv` o las particiones `nombre_visible_agente=*`), para que los
+    agentes que ya no aparecen no dejen archivos obsoletos.
+    """
+    if output_format == 'parquet':
+        pattern = os.path.join(output_dir, f"{MasterDataIndex.AGENT_COLUMN}=*")
+    else:
+        pattern = os.path.join(output_dir, "*.csv")
+    for path in glob.glob(pattern):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+@instrument_stage()
+def save_results_by_agent(data: pd.DataFrame, output_dir: str, output_format: str = 'csv'):
+    """
+    Guarda un archivo por agente (`<agente>.csv`) o, con `output_format='parquet'`,
+    un dataset Parquet particionado por `nombre_visible_agente`. Los reportes
+    anteriores del mismo formato en `output_dir` se reemplazan por completo.
+    """
+    try:
+        logging.info(f"Guardando resultados por agente en {output_dir} ({output_format}).")
+        if output_format not in AGENT_OUTPUT_FORMATS:
+            raise ValueError(f"Formato de salida no soportado: {output_format}")
+        os.makedirs(output_dir, exist_ok=True)
+        clear_agent_outputs(output_dir, output_format)
+        if output_format == 'parquet':
+            data.to_parquet(
+                output_dir,
+                partition_cols=[MasterDataIndex.AGENT_COLUMN],
+                index=False
+            )
+        else:
+            for agent, agent_data in data.groupby(MasterDataIndex.AGENT_COLUMN, sort=False):
+                agent_data.to_csv(os.path.join(output_dir, f"{agent_slug(agent)}.csv"), index=False)
+    except Exception as e:
+        logging.error(f"Error guardando los resultados por agente: {e}")
+        raise
+
+
+def market_date_from_filename(file_path: str, year: int = DEFAULT_MARKET_YEAR):
+    """
+    Fecha de mercado a partir del nombre `dDECMMDD.txt` (el año no viene en el nombre).
+    """
+    match = DDEC_FILE_PATTERN.search(os.path.basename(file_path))
+    if match is None:
+        raise ValueError(f"El nombre del archivo no tiene el formato dDECMMDD: {file_path}")
+    month, day = match.groups()
+    return f"{year:04d}-{month}-{day}"
+
+
+def list_ddec_files(input_path: str):
+    if os.path.isdir(input_path):
+        return sorted(
+            os.path.join(input_path, name)
+            for name in os.listdir(input_path)
+            if name.lower().startswith('ddec') and name.lower().endswith('.txt')
+        )
+    return sorted(glob.glob(input_path))
+
+
+worker_state = {}
+
+
+def init_ddec_worker(master_data: pd.DataFrame):
+    worker_state['index'] = MasterDataIndex(master_data)
+
+
+def process_ddec_file(file_path: str, year: int = DEFAULT_MARKET_YEAR, agent: str = None, plant_types=None,
+                      engine: str = "c"):
+    """
+    Procesa un archivo dDEC dentro de un proceso del pool, usando el índice de
+    datos maestros recibido al iniciar el proceso.
+    """
+    market_date = market_date_from_filename(file_path, year)
+    ddec_data = read_ddec_data(file_path, engine=engine)
+    result = calculate_horizontal_sum(
+        worker_state['index'].join(ddec_data=ddec_data, agent=agent, plant_types=plant_types)
+    )
+    result['market_date'] = market_date
+    return result
+
+
+@instrument_stage()
+def process_ddec_files(master_data: pd.DataFrame, file_paths, output_dir: str, year: int = DEFAULT_MARKET_YEAR,
+                       workers: int = None, agent: str = None, plant_types=None, engine: str = "c"):
+    """
+    Procesa varios archivos dDEC en paralelo. Los datos maestros se envían una
+    sola vez a cada proceso y el proceso principal es el único que escribe, en
+    el dataset silver particionado por `market_date` y agente.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    summary = {'files': 0, 'rows': 0, 'failed': []}
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_ddec_worker, initargs=(master_data,)) as executor:
+        futures = {
+            executor.submit(process_ddec_file, file_path, year, agent, plant_types, engine): file_path
+            for file_path in file_paths
+        }
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error(f"Error procesando el archivo dDEC {file_path}: {e}")
+                summary['failed'].append(file_path)
+                continue
+
+            if not result.empty:
+                save_results_silver(result, output_dir)
+            summary['files'] += 1
+            summary['rows'] += len(result)
+
+    summary['seconds'] = time.perf_counter() - start
+    summary['files_per_second'] = summary['files'] / summary['seconds'] if summary['seconds'] else 0.0
+    logging.info(
+        f"Procesamiento por lotes dDEC: {summary['files']} archivos, {summary['rows']} filas, "
+        f"{len(summary['failed'])} con error, {summary['files_per_second']:.2f} archivos/s."
+    )
+    return summary
@@ -1,14 +1,29 @@
 # main.py
 import os
 import logging
+import argparse
 from core import (
     load_master_data,
-    filter_master_data,
-    load_ddec_data,
-    merge_datasets,
+    load_master_data_cached,
+    build_master_index,
+    read_ddec_data,
     calculate_horizontal_sum,
-    save_results
+    calculate_all_agents,
+    summarize_by_agent,
+    save_results,
+    save_results_by_agent,
+    save_results_silver,
+    market_date_from_filename,
+    list_ddec_files,
+    process_ddec_files,
+    DEFAULT_MARKET_YEAR,
+    AGENT_OUTPUT_FORMATS
 )
+from common.instrumentation import start_run, write_run_report
+from common.pipeline import Pipeline
+from common.silver import silver_path
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
 
 def configure_logging():
@@ -26,36 +41,73 @@ def configure_logging():
 
     return logger
 
-def main():
+def main(use_cache=True, agent="EMGESA", plant_types=("H", "T"), all_agents=False, output_format="csv",
+         ddec_engine="c"):
     logger = configure_logging()
+    start_run("punto_2")
     try:
         logger.info("Inicio del proceso.")
 
         raw_data_path = "../raw_data"
         processed_data_path = "../processed_data"
+        cache_dir = os.path.join(processed_data_path, "cache")
 
         master_data_file = os.path.join(raw_data_path, "Datos Maestros VF.xlsx")
         ddec_file = os.path.join(raw_data_path, "dDEC1204.txt")
         output_file = os.path.join(processed_data_path, "filtered_results.csv")
+        silver_dir = silver_path("..", "ddec_results")
 
-        master_data = load_master_data(
-            file_path=master_data_file
-        )
+        if use_cache:
+            master_data = load_master_data_cached(
+                file_path=master_data_file,
+                cache_dir=cache_dir
+            )
+        else:
+            master_data = load_master_data(
+                file_path=master_data_file
+            )
         # print(master_data)
         # print(master_data.columns)
 
-        filtered_master_data = filter_master_data(
+        master_index = build_master_index(
             master_data=master_data
         )
-        # print(filtered_master_data)
-        ddec_data = load_ddec_data(
-            file_path=ddec_file
+        ddec_data = read_ddec_data(
+            file_path=ddec_file,
+            engine=ddec_engine
         )
         # print(ddec_data)
-        merged_data = merge_datasets(
-            master_data=filtered_master_data, 
-            ddec_data=ddec_data
+
+        if all_agents:
+            agents_dir = os.path.join(processed_data_path, AGENT_OUTPUT_FORMATS[output_format])
+            result_data = calculate_all_agents(
+                master_index=master_index,
+                ddec_data=ddec_data,
+                plant_types=plant_types
+            )
+            save_results_by_agent(
+                data=result_data,
+                output_dir=agents_dir,
+                output_format=output_format
+            )
+            save_results(
+                data=summarize_by_agent(result_data),
+                output_file=os.path.join(processed_data_path, "agents_summary.csv")
+            )
+            save_results_silver(
+                data=result_data,
+                dataset_dir=silver_dir,
+                market_date=market_date_from_filename(ddec_file)
+            )
+            logger.info(f"Proceso completado. Reportes por agente generados en: {agents_dir}")
+            return
+
+        merged_data = master_index.join(
+            ddec_data=ddec_data,
+            agent=agent,
+            plant_types=plant_types
         )
+
         # print(merged_data)
 
         result_data = calculate_horizontal_sum(
@@ -68,12 +120,171 @@ def main():
             data=result_data, 
             output_file=output_file
         )
+        save_results_silver(
+            data=result_data,
+            dataset_dir=silver_dir,
+            market_date=market_date_from_filename(ddec_file)
+        )
 
         logger.info(f"Proceso completado. Archivo generado en: {output_file}")
 
     except Exception as e:
         logger.error(f"Error en el proceso: {e}")
+    finally:
+        write_run_report("../logs/punto_2_run_report.json")
+
+
+def main_batch(input_path, year=DEFAULT_MARKET_YEAR, workers=None, agent="EMGESA", plant_types=("H", "T"),
+               use_cache=True, ddec_engine="c"):
+    logger = configure_logging()
+    start_run("punto_2_batch")
+    try:
+        logger.info(f"Inicio del procesamiento por lotes desde: {input_path}")
+
+        raw_data_path = "../raw_data"
+        processed_data_path = "../processed_data"
+        cache_dir = os.path.join(processed_data_path, "cache")
+        output_dir = silver_path("..", "ddec_results")
+        master_data_file = os.path.join(raw_data_path, "Datos Maestros VF.xlsx")
+
+        file_paths = list_ddec_files(input_path)
+        if not file_paths:
+            logger.warning(f"No se encontraron archivos dDEC en: {input_path}")
+            return
+
+        if use_cache:
+            master_data = load_master_data_cached(
+                file_path=master_data_file,
+                cache_dir=cache_dir
+            )
+        else:
+            master_data = load_master_data(
+                file_path=master_data_file
+            )
+
+        summary = process_ddec_files(
+            master_data=master_data,
+            file_paths=file_paths,
+            output_dir=output_dir,
+            year=year,
+            workers=workers,
+            agent=agent,
+            plant_types=plant_types,
+            engine=ddec_engine
+        )
+        logger.info(
+            f"Proceso completado: {summary['files']} archivos en {summary['seconds']:.2f} s "
+            f"({summary['files_per_second']:.2f} archivos/s). Resultado en: {output_dir}"
+        )
+
+    except Exception as e:
+        logger.error(f"Error en el proceso por lotes: {e}")
+    finally:
+        write_run_report("../logs/punto_2_run_report.json")
+
+
+def join_master_ddec(master_index, ddec_data, agent, plant_types):
+    """Une los datos maestros indexados con el dDEC (etapa del pipeline)."""
+    return master_index.join(ddec_data=ddec_data, agent=agent, plant_types=plant_types)
+
+
+def build_pipeline(base_dir=BASE_DIR, agent="EMGESA", plant_types=("H", "T"), ddec_engine="c"):
+    """
+    Declara el flujo de `main` como pipeline: la carga del Excel y la del
+    archivo dDEC son independientes y se ejecutan en paralelo.
+    """
+    master_data_file = os.path.join(base_dir, "raw_data", "Datos Maestros VF.xlsx")
+    ddec_file = os.path.join(base_dir, "raw_data", "dDEC1204.txt")
+    processed_data_path = os.path.join(base_dir, "processed_data")
+    output_file = os.path.join(processed_data_path, "filtered_results.csv")
+    silver_dir = silver_path(base_dir, "ddec_results")
+
+    pipeline = Pipeline("punto_2", state_dir=os.path.join(base_dir, "logs", "pipeline"))
+    pipeline.add_stage(
+        "master_data", load_master_data_cached,
+        params={"file_path": master_data_file, "cache_dir": os.path.join(processed_data_path, "cache")},
+        input_files=[master_data_file]
+    )
+    pipeline.add_stage(
+        "ddec_data", read_ddec_data,
+        params={"file_path": ddec_file, "engine": ddec_engine},
+        input_files=[ddec_file]
+    )
+    pipeline.add_stage(
+        "master_index", build_master_index,
+        inputs={"master_data": "master_data"}
+    )
+    pipeline.add_stage(
+        "merged_data", join_master_ddec,
+        inputs={"master_index": "master_index", "ddec_data": "ddec_data"},
+        params={"agent": agent, "plant_types": plant_types}
+    )
+    pipeline.add_stage(
+        "result_data", calculate_horizontal_sum,
+        inputs={"data": "merged_data"}
+    )
+    pipeline.add_stage(
+        "save_results", save_results,
+        inputs={"data": "result_data"},
+        params={"output_file": output_file},
+        output_files=[output_file]
+    )
+    pipeline.add_stage(
+        "silver", save_results_silver,
+        inputs={"data": "result_data"},
+        params={"dataset_dir": silver_dir, "market_date": market_date_from_filename(ddec_file)},
+        output_files=[silver_dir]
+    )
+    return pipeline
+
+
+def main_pipeline(force=False, **kwargs):
+    logger = configure_logging()
+    start_run("punto_2_pipeline")
+    try:
+        build_pipeline(**kwargs).run(force=force)
+    except Exception as e:
+        logger.error(f"Error en el pipeline: {e}")
+    finally:
+        write_run_report(os.path.join(BASE_DIR, "logs", "punto_2_run_report.json"))
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Procesamiento de archivos dDEC con datos maestros.")
+    parser.add_argument("--input", help="Directorio o patrón glob de archivos dDEC para el proceso por lotes.")
+    parser.add_argument("--year", type=int, default=DEFAULT_MARKET_YEAR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--agent", default="EMGESA")
+    parser.add_argument("--plant-types", nargs="*", default=["H", "T"])
+    parser.add_argument("--all-agents", action="store_true")
+    parser.add_argument("--output-format", choices=list(AGENT_OUTPUT_FORMATS), default="csv")
+    parser.add_argument("--ddec-engine", choices=["c", "pyarrow"], default="c")
+    parser.add_argument("--pipeline", action="store_true", help="Ejecuta el flujo como pipeline (DAG).")
+    parser.add_argument("--force", action="store_true", help="Con --pipeline, ejecuta todas las etapas.")
+    args = parser.parse_args()
+
+    plant_types = args.plant_types or None
+    if args.pipeline:
+        main_pipeline(
+            force=args.force,
+            agent=args.agent,
+            plant_types=plant_types,
+            ddec_engine=args.ddec_engine
+        )
+    elif args.input:
+        main_batch(
+            args.input,
+            year=args.year,
+            workers=args.workers,
+            agent=None if args.all_agents else args.agent,
+            plant_types=plant_types,
+            ddec_engine=args.ddec_engine
+        )
+    else:
+        main(
+            agent=args.agent,
+            plant_types=plant_types,
+            all_agents=args.all_agents,
+            output_format=args.output_format,
+            ddec_engine=args.ddec_engine
+        )
@@ -0,0 +1,370 @@
+import os
+import time
+import logging
+import argparse
+import tempfile
+import pandas as pd
+import pyarrow.parquet as pq
+from core import (
+    connect_to_db,
+    create_weather_table,
+    insert_dummy_data_with_faker,
+    insert_synthetic_weather_data,
+    write_synthetic_weather_parquet,
+    partition_weather_data,
+    list_weather_partitions,
+    close_connection,
+    PARTITIONED_VIEW
+)
+from weather_data_transformations import (
+    create_weather_data_fahrenheit_table,
+    populate_weather_data_fahrenheit,
+    add_temperature_delta_columns,
+    calculate_temperature_deltas,
+    TRANSFORM_BACKENDS
+)
+from weather_rollups import refresh_weather_rollups, query_rollup, MONTHLY_AVERAGE_VIEW
+from main import export_table_to_silver
+from common.export import export_table_to_csv, export_table_to_parquet
+from common.silver import read_silver, plan_silver_scan
+
+logger = logging.getLogger()
+
+
+
+def time_call(func, *args, **kwargs):
+    """
+    Run a function and return the elapsed time and its result.
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def legacy_temperature_deltas(connection):
+    """
+    Previous implementation: unindexed temp tables and one correlated-subquery
+    UPDATE per column and table (quadratic in the number of rows).
+    """
+    cursor = connection.cursor()
+    for temp_table, column, order_by in [
+        ("DeltaHourly", "delta_horaria", "fecha_y_hora"),
+        ("DeltaDaily", "delta_diaria", "DATE(fecha_y_hora)"),
+    ]:
+        cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {temp_table} AS
+        SELECT
+            id,
+            temperatura - LAG(temperatura) OVER (
+                PARTITION BY localidad ORDER BY {order_by}
+            ) AS {column}
+        FROM weather_data;
+        """)
+        target = "delta_temperatura_horaria" if column == "delta_horaria" else "delta_temperatura_diaria"
+        for table_name in ("weather_data", "weather_data_fahrenheit"):
+            cursor.execute(f"""
+            UPDATE {table_name}
+            SET {target} = (
+                SELECT {column}
+                FROM {temp_table}
+                WHERE {temp_table}.id = {table_name}.id
+            );
+            """)
+    connection.commit()
+
+
+def prepare_database(db_path, rows):
+    conn = connect_to_db(db_path)
+    create_weather_table(conn)
+    insert_synthetic_weather_data(conn, rows, seed=0, step_hours=1)
+    create_weather_data_fahrenheit_table(conn)
+    populate_weather_data_fahrenheit(conn)
+    add_temperature_delta_columns(conn)
+    return conn
+
+
+def benchmark_deltas(rows, baseline_max_rows=20000):
+    """
+    Time `calculate_temperature_deltas` on `rows` synthetic readings. Up to
+    `baseline_max_rows` the legacy implementation is also timed and its
+    results compared.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = prepare_database(os.path.join(tmp_dir, "weather.db"), rows)
+        set_based_time, _ = time_call(calculate_temperature_deltas, conn)
+        print(f"Rows: {rows:,}")
+        print(f"  set-based: {set_based_time:8.2f} s ({rows / set_based_time:,.0f} rows/s)")
+
+        if rows <= baseline_max_rows:
+            tables = ("weather_data", "weather_data_fahrenheit")
+            query = " UNION ALL ".join(
+                f"SELECT id, delta_temperatura_horaria, delta_temperatura_diaria FROM {table_name}"
+                for table_name in tables
+            )
+            expected = conn.execute(query).fetchall()
+            for table_name in tables:
+                conn.execute(
+                    f"UPDATE {table_name} SET delta_temperatura_horaria = NULL, delta_temperatura_diaria = NULL;"
+                )
+            legacy_time, _ = time_call(legacy_temperature_deltas, conn)
+            matches = conn.execute(query).fetchall() == expected
+            print(f"  legacy   : {legacy_time:8.2f} s ({rows / legacy_time:,.0f} rows/s) | same results: {matches}")
+        close_connection(conn)
+    return set_based_time
+
+
+def benchmark_incremental(rows, batch_rows, batches=3):
+    """
+    Time incremental delta runs for `batches` new batches of `batch_rows`
+    readings on top of `rows` existing readings, against a full recompute.
+    """
+    query = "SELECT id, delta_temperatura_horaria, delta_temperatura_diaria FROM weather_data ORDER BY id"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = prepare_database(os.path.join(tmp_dir, "weather.db"), rows)
+        calculate_temperature_deltas(conn)
+
+        print(f"Rows: {rows:,} | batch: {batch_rows:,}")
+        for batch in range(batches):
+            next_hour = conn.execute("SELECT DATETIME(MAX(fecha_y_hora), '+1 hour') FROM weather_data;").fetchone()[0]
+            insert_synthetic_weather_data(conn, batch_rows, seed=batch + 1, start_date=next_hour, step_hours=1)
+            incremental_time, _ = time_call(calculate_temperature_deltas, conn, incremental=True)
+            print(f"  batch {batch + 1} incremental: {incremental_time:8.3f} s")
+
+        incremental_results = conn.execute(query).fetchall()
+        full_time, _ = time_call(calculate_temperature_deltas, conn)
+        matches = conn.execute(query).fetchall() == incremental_results
+        print(f"  full recompute     : {full_time:8.3f} s | same results: {matches}")
+        close_connection(conn)
+
+
+def benchmark_backends(rows):
+    """
+    Run the Fahrenheit table and the deltas with each compute backend on the
+    same synthetic readings and compare times and results with the SQL path.
+    """
+    query = """
+    SELECT w.id, w.delta_temperatura_horaria, w.delta_temperatura_diaria,
+           f.temperatura_fahrenheit, f.fecha_y_hora, f.delta_temperatura_horaria, f.delta_temperatura_diaria
+    FROM weather_data AS w JOIN weather_data_fahrenheit AS f ON f.id = w.id
+    ORDER BY w.id
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"Rows: {rows:,}")
+        for backend, transforms in TRANSFORM_BACKENDS.items():
+            conn = connect_to_db(os.path.join(tmp_dir, f"{backend}.db"))
+            create_weather_table(conn)
+            insert_synthetic_weather_data(conn, rows, seed=0, step_hours=1)
+            create_weather_data_fahrenheit_table(conn)
+            fahrenheit_time, _ = time_call(transforms["populate_fahrenheit"], conn)
+            add_temperature_delta_columns(conn)
+            deltas_time, _ = time_call(transforms["calculate_deltas"], conn)
+            results[backend] = conn.execute(query).fetchall()
+            close_connection(conn)
+
+            matches = all(
+                row == expected or all(
+                    a == b or (a is not None and b is not None and abs(a - b) < 1e-9)
+                    for a, b in zip(row, expected)
+                )
+                for row, expected in zip(results[backend], results["sql"])
+            ) and len(results[backend]) == len(results["sql"])
+            print(f"  {backend:7s} fahrenheit: {fahrenheit_time:7.2f} s | deltas: {deltas_time:7.2f} s "
+                  f"| same results as sql: {matches}")
+
+
+def benchmark_rollups(rows, batch_rows=1000, batches=3):
+    """
+    Time the full rollup build, typical dashboard queries on weather_data
+    against the rollups, and incremental refreshes of `batch_rows` new
+    readings (checked against a rebuild).
+    """
+    dashboard_queries = {
+        "monthly_avg_temperature": (
+            "SELECT strftime('%Y-%m', fecha_y_hora) AS mes, AVG(temperatura) FROM weather_data GROUP BY mes",
+            f"SELECT mes, avg_temperatura FROM {MONTHLY_AVERAGE_VIEW}",
+        ),
+        "daily_stats_one_localidad": (
+            "SELECT DATE(fecha_y_hora) AS fecha, MIN(temperatura), MAX(temperatura), AVG(indice_uv), "
+            "AVG(velocidad_viento) FROM weather_data WHERE localidad = 'Laureles' GROUP BY fecha",
+            "SELECT fecha, min_temperatura, max_temperatura, avg_indice_uv, avg_velocidad_viento "
+            "FROM weather_daily_rollup WHERE localidad = 'Laureles'",
+        ),
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = connect_to_db(os.path.join(tmp_dir, "rollups.db"))
+        create_weather_table(conn)
+        insert_synthetic_weather_data(conn, rows, seed=0, step_hours=1)
+        build_time, _ = time_call(refresh_weather_rollups, conn)
+        print(f"Rows: {rows:,} | full build: {build_time:.2f} s")
+
+        for name, (raw_query, rollup_query) in dashboard_queries.items():
+            raw_time = best_time(conn, raw_query, ())
+            rollup_time = best_time(conn, rollup_query, ())
+            print(f"  {name:26s} weather_data: {raw_time:7.4f} s | rollup: {rollup_time:7.4f} s")
+
+        for batch in range(batches):
+            next_hour = conn.execute("SELECT DATETIME(MAX(fecha_y_hora), '+1 hour') FROM weather_data;").fetchone()[0]
+            insert_synthetic_weather_data(conn, batch_rows, seed=batch + 1, start_date=next_hour, step_hours=1)
+            refresh_time, _ = time_call(refresh_weather_rollups, conn)
+            print(f"  batch {batch + 1} incremental refresh: {refresh_time:8.3f} s")
+
+        incremental = query_rollup(conn, "daily"), query_rollup(conn, "monthly")
+        refresh_weather_rollups(conn, rebuild=True)
+        rebuilt = query_rollup(conn, "daily"), query_rollup(conn, "monthly")
+        matches = all(
+            len(a) == len(b) and all(
+                x == y or (isinstance(x, float) and isinstance(y, float) and abs(x - y) < 1e-9)
+                for row_a, row_b in zip(a, b) for x, y in zip(row_a, row_b)
+            )
+            for a, b in zip(incremental, rebuilt)
+        )
+        print(f"  same results as rebuild: {matches}")
+        close_connection(conn)
+
+
+def benchmark_silver(rows, localidad="Laureles", month="2025-06"):
+    """
+    Read one localidad and month from the CSV export, from a single Parquet
+    file and from the partitioned silver dataset.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = connect_to_db(os.path.join(tmp_dir, "weather.db"))
+        create_weather_table(conn)
+        insert_synthetic_weather_data(conn, rows, seed=0, step_hours=1)
+        csv_path = os.path.join(tmp_dir, "weather_data.csv")
+        parquet_path = os.path.join(tmp_dir, "weather_data.parquet")
+        silver_dir = os.path.join(tmp_dir, "silver", "weather_data")
+        export_table_to_csv(conn, "weather_data", csv_path)
+        export_table_to_parquet(conn, "weather_data", parquet_path)
+        silver_time, _ = time_call(export_table_to_silver, conn, "weather_data", silver_dir)
+        close_connection(conn)
+
+        start, end = f"{month}-01", f"{month}-31 23:59:59"
+        readers = {
+            "csv (full read + filter)": lambda: (
+                lambda df: df[(df["localidad"] == localidad) & df["fecha_y_hora"].str.startswith(month)]
+            )(pd.read_csv(csv_path)),
+            "single parquet (filters)": lambda: pq.read_table(parquet_path, filters=[
+                ("localidad", "=", localidad), ("fecha_y_hora", ">=", start), ("fecha_y_hora", "<=", end)
+            ]).to_pandas(),
+            "silver (partition pruning)": lambda: read_silver(
+                silver_dir, filters=[("localidad", "=", localidad), ("mes", "=", month)]
+            ),
+        }
+        print(f"Rows: {rows:,} | silver write: {silver_time:.2f} s | "
+              f"plan: {plan_silver_scan(silver_dir, [('localidad', '=', localidad), ('mes', '=', month)])}")
+        for name, reader in readers.items():
+            elapsed = min(time_call(reader)[0] for _ in range(3))
+            print(f"  {name:28s}: {elapsed:7.4f} s ({len(reader()):,} rows)")
+
+
+def layout_queries(table_name, localidad, start, end):
+    """
+    Typical queries on a weather layout: a date range across localidades,
+    the latest reading per localidad and the hourly deltas of one localidad.
+    """
+    return {
+        "date_range": (
+            f"SELECT localidad, COUNT(*), AVG(temperatura) FROM {table_name} "
+            "WHERE fecha_y_hora >= ? AND fecha_y_hora < ? GROUP BY localidad",
+            (start, end),
+        ),
+        "latest_per_localidad": (
+            f"SELECT localidad, MAX(fecha_y_hora) FROM {table_name} GROUP BY localidad",
+            (),
+        ),
+        "window_deltas": (
+            "SELECT id, temperatura - LAG(temperatura) OVER (ORDER BY fecha_y_hora, id) "
+            f"FROM {table_name} WHERE localidad = ? AND fecha_y_hora >= ? AND fecha_y_hora < ?",
+            (localidad, start, end),
+        ),
+    }
+
+
+def best_time(conn, query, params, repeat=3):
+    """
+    Best time of `repeat` runs of a query.
+    """
+    return min(time_call(lambda: conn.execute(query, params).fetchall())[0] for _ in range(repeat))
+
+
+def benchmark_layouts(rows, localidad="Laureles", start="2025-06-01", end="2025-07-01"):
+    """
+    Compare the plain (no indexes), indexed and month-partitioned layouts.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = connect_to_db(os.path.join(tmp_dir, "layouts.db"))
+        create_weather_table(conn)
+        insert_synthetic_weather_data(conn, rows, seed=0, step_hours=1)
+        conn.execute("CREATE TABLE weather_data_plain AS SELECT * FROM weather_data;")
+        partition_time, _ = time_call(partition_weather_data, conn)
+        partitions = len(list_weather_partitions(conn))
+
+        print(f"Rows: {rows:,} | partitions: {partitions} ({partition_time:.2f} s to build)")
+        layouts = {"plain": "weather_data_plain", "indexed": "weather_data", "partitioned": PARTITIONED_VIEW}
+        for name in layout_queries("", localidad, start, end):
+            times = {
+                layout: best_time(conn, *layout_queries(table_name, localidad, start, end)[name])
+                for layout, table_name in layouts.items()
+            }
+            print(f"  {name:22s} " + " | ".join(f"{layout}: {elapsed:7.4f} s" for layout, elapsed in times.items()))
+        close_connection(conn)
+
+
+def benchmark_generator(rows, baseline_max_rows=100000):
+    """
+    Compare `insert_dummy_data_with_faker` (up to `baseline_max_rows`) with the
+    vectorized generator streaming into SQLite and into Parquet.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = {}
+        if rows <= baseline_max_rows:
+            conn = connect_to_db(os.path.join(tmp_dir, "faker.db"))
+            create_weather_table(conn, create_indexes=False)
+            results["faker loop -> sqlite"] = time_call(insert_dummy_data_with_faker, conn, rows)[0]
+            close_connection(conn)
+
+        conn = connect_to_db(os.path.join(tmp_dir, "synthetic.db"))
+        create_weather_table(conn, create_indexes=False)
+        results["vectorized -> sqlite"] = time_call(insert_synthetic_weather_data, conn, rows, seed=0)[0]
+        close_connection(conn)
+
+        results["vectorized -> parquet"] = time_call(
+            write_synthetic_weather_parquet, os.path.join(tmp_dir, "synthetic.parquet"), rows, seed=0
+        )[0]
+
+    print(f"Rows: {rows:,}")
+    for name, elapsed in results.items():
+        print(f"  {name:22s}: {elapsed:8.2f} s ({rows / elapsed:,.0f} rows/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temperature delta benchmarks.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 1000000, 10000000])
+    parser.add_argument("--baseline-max-rows", type=int, default=20000)
+    parser.add_argument("--suite", choices=["deltas", "layouts", "generator", "backends", "rollups", "silver"], default="deltas")
+    parser.add_argument("--incremental", action="store_true", help="Benchmark incremental runs instead.")
+    parser.add_argument("--batch-rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    for rows in args.rows:
+        if args.suite == "layouts":
+            benchmark_layouts(rows)
+        elif args.suite == "generator":
+            benchmark_generator(rows)
+        elif args.suite == "backends":
+            benchmark_backends(rows)
+        elif args.suite == "rollups":
+            benchmark_rollups(rows, args.batch_rows)
+        elif args.suite == "silver":
+            benchmark_silver(rows)
+        elif args.incremental:
+            benchmark_incremental(rows, args.batch_rows)
+        else:
+            benchmark_deltas(rows, args.baseline_max_rows)
+
+
+if __name__ == "__main__":
+    main()
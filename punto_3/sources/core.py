@@ -1,20 +1,56 @@
 import sqlite3
 import os
+import re
+import sys
 import logging
 import random
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from datetime import datetime, timedelta
 from faker import Faker
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.instrumentation import instrument_stage
+from common.database import connect_sqlite
+
 logging.basicConfig(
     filename=os.path.join(os.path.dirname(__file__), '../logs/punto_3.log'),
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+WEATHER_INDEX_COLUMNS = {
+    "localidad_fecha": "(localidad, fecha_y_hora)",
+    "fecha_y_hora": "(fecha_y_hora)",
+}
+PARTITIONED_VIEW = "weather_data_by_month"
+PARTITION_NAME_GLOB = "weather_data_[0-9][0-9][0-9][0-9]_[0-9][0-9]"
+# SQLite limits a compound SELECT to 500 terms by default (SQLITE_MAX_COMPOUND_SELECT).
+MAX_VIEW_PARTITIONS = 500
+
+LOCALIDADES = ['El Poblado', 'Laureles', 'Belen', 'Robledo', 'Castilla', 'Buenos Aires', 'Aranjuez']
+COBERTURA_NUBES = np.array(['Mínima', 'Parcial', 'Total'], dtype=object)
+SYNTHETIC_CHUNK_SIZE = 500000
+SYNTHETIC_SCHEMA = pa.schema([
+    ("localidad", pa.string()),
+    ("pais", pa.string()),
+    ("temperatura", pa.float64()),
+    ("fecha_y_hora", pa.string()),
+    ("cobertura_nubes", pa.string()),
+    ("indice_uv", pa.float64()),
+    ("presion_atmosferica", pa.float64()),
+    ("velocidad_viento", pa.float64()),
+])
+
+
 def connect_to_db(db_path):
+    """
+    Open a SQLite connection with the shared pragmas (WAL, cache, mmap, ...).
+    """
     try:
-        conn = sqlite3.connect(db_path)
+        conn = connect_sqlite(db_path)
         logging.info(f"Connected to database at {db_path}")
         return conn
     except sqlite3.Error as e:
@@ -22,7 +58,8 @@ def connect_to_db(db_path):
         return None
 
 
-def create_weather_table(conn):
+@instrument_stage()
+def create_weather_table(conn, create_indexes=True):
     try:
         cursor = conn.cursor()
         create_table_query = """
@@ -41,12 +78,115 @@ def create_weather_table(conn):
         );
         """
         cursor.execute(create_table_query)
+        if create_indexes:
+            create_weather_indexes(conn)
         conn.commit()
         logging.info("Table 'weather_data' created successfully.")
     except sqlite3.Error as e:
         logging.error(f"Error creating table: {e}")
 
 
+def create_weather_indexes(conn, table_name="weather_data"):
+    """
+    Create the (localidad, fecha_y_hora) and fecha_y_hora indexes on a weather table.
+    """
+    for suffix, columns in WEATHER_INDEX_COLUMNS.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_{suffix} ON {table_name} {columns};")
+
+
+def table_columns(conn, table_name):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table_name});")]
+
+
+def list_weather_partitions(conn):
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name;",
+        (PARTITION_NAME_GLOB,)
+    )
+    return [row[0] for row in rows]
+
+
+def create_partitioned_view(conn, partitions):
+    """
+    Recreate the UNION ALL view over the month partitions, using the columns
+    all partitions share.
+    """
+    conn.execute(f"DROP VIEW IF EXISTS {PARTITIONED_VIEW};")
+    if not partitions:
+        return
+    if len(partitions) > MAX_VIEW_PARTITIONS:
+        logging.warning(
+            f"{len(partitions)} partitions exceed the {MAX_VIEW_PARTITIONS} terms of a compound SELECT; "
+            f"view '{PARTITIONED_VIEW}' not created."
+        )
+        return
+    shared = set.intersection(*(set(table_columns(conn, partition)) for partition in partitions))
+    columns = ", ".join(column for column in table_columns(conn, partitions[0]) if column in shared)
+    conn.execute(
+        f"CREATE VIEW {PARTITIONED_VIEW} AS "
+        + " UNION ALL ".join(f"SELECT {columns} FROM {partition}" for partition in partitions)
+        + ";"
+    )
+
+
+@instrument_stage()
+def partition_weather_data(conn, rebuild=False):
+    """
+    Copy weather_data into month tables (weather_data_YYYY_MM, same schema
+    and indexes) and recreate the weather_data_by_month UNION ALL view.
+    Rows keep their id and only rows above the highest partitioned id are
+    copied, so it can run after every load; use `rebuild=True` to refresh
+    rows updated in weather_data (e.g. recomputed deltas).
+    """
+    try:
+        cursor = conn.cursor()
+        if rebuild:
+            cursor.execute(f"DROP VIEW IF EXISTS {PARTITIONED_VIEW};")
+            for partition in list_weather_partitions(conn):
+                cursor.execute(f"DROP TABLE {partition};")
+
+        last_id = max(
+            (cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {partition};").fetchone()[0]
+             for partition in list_weather_partitions(conn)),
+            default=0
+        )
+        table_sql = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'weather_data';"
+        ).fetchone()[0]
+        months = [
+            row[0] for row in cursor.execute(
+                "SELECT DISTINCT strftime('%Y-%m-01', fecha_y_hora) FROM weather_data WHERE id > ?;",
+                (last_id,)
+            )
+        ]
+
+        copied = 0
+        for month_start in months:
+            partition = f"weather_data_{month_start[:7].replace('-', '_')}"
+            cursor.execute(re.sub(
+                r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?"?weather_data"?',
+                f"CREATE TABLE IF NOT EXISTS {partition}",
+                table_sql
+            ))
+            create_weather_indexes(conn, partition)
+            columns = ", ".join(table_columns(conn, partition))
+            # The fecha_y_hora index limits each copy to the rows of its month.
+            cursor.execute(f"""
+            INSERT INTO {partition} ({columns})
+            SELECT {columns}
+            FROM weather_data
+            WHERE fecha_y_hora >= ? AND fecha_y_hora < DATE(?, '+1 month') AND id > ?;
+            """, (month_start, month_start, last_id))
+            copied += cursor.rowcount
+
+        create_partitioned_view(conn, list_weather_partitions(conn))
+        conn.commit()
+        logging.info(f"{copied} rows copied into {len(months)} month partitions.")
+        return copied
+    except sqlite3.Error as e:
+        logging.error(f"Error partitioning weather data: {e}")
+
+
 def determine_cobertura_nubes(temperatura, velocidad_viento):
     if temperatura > 28 and velocidad_viento < 5:
         return 'Mínima'
@@ -56,6 +196,103 @@ def determine_cobertura_nubes(temperatura, velocidad_viento):
         return 'Total'
 
 
+def determine_cobertura_nubes_vectorized(temperatura, velocidad_viento):
+    """
+    `determine_cobertura_nubes` over NumPy arrays.
+    """
+    codes = np.select(
+        [
+            (temperatura > 28) & (velocidad_viento < 5),
+            (temperatura >= 20) & (temperatura <= 28) & (velocidad_viento >= 5) & (velocidad_viento <= 10),
+        ],
+        [0, 1],
+        default=2
+    )
+    return COBERTURA_NUBES[codes]
+
+
+def generate_weather_chunks(num_records, seed=None, chunk_size=SYNTHETIC_CHUNK_SIZE,
+                            start_date="2024-01-01 00:00:00", step_hours=24, localidades=LOCALIDADES):
+    """
+    Yield synthetic weather readings in chunks of `chunk_size` rows, as dicts
+    of NumPy arrays keyed by column. As in `insert_dummy_data_with_faker`,
+    each localidad advances `step_hours` per reading from `start_date`.
+    The same `seed` always yields the same data.
+    """
+    rng = np.random.default_rng(seed)
+    names = np.array(localidades, dtype=object)
+    readings = np.zeros(len(localidades), dtype=np.int64)
+    start = np.datetime64(start_date, "s")
+    step = np.timedelta64(step_hours * 3600, "s")
+
+    for offset in range(0, num_records, chunk_size):
+        size = min(chunk_size, num_records - offset)
+        codes = rng.integers(0, len(localidades), size)
+
+        # Reading number of every row within its localidad.
+        counts = np.bincount(codes, minlength=len(localidades))
+        order = np.argsort(codes, kind="stable")
+        position = np.empty(size, dtype=np.int64)
+        position[order] = np.arange(size) - np.repeat(np.cumsum(counts) - counts, counts)
+        position += readings[codes]
+        readings += counts
+
+        # Format each distinct timestamp once.
+        distinct, inverse = np.unique(position, return_inverse=True)
+        timestamps = np.char.replace(np.datetime_as_string(start + distinct * step, unit="s"), "T", " ")
+
+        temperatura = np.round(rng.uniform(15.0, 35.0, size), 1)
+        velocidad_viento = np.round(rng.uniform(0.0, 15.0, size), 1)
+        yield {
+            "localidad": names[codes],
+            "pais": np.full(size, "Colombia", dtype=object),
+            "temperatura": temperatura,
+            "fecha_y_hora": timestamps.astype(object)[inverse],
+            "cobertura_nubes": determine_cobertura_nubes_vectorized(temperatura, velocidad_viento),
+            "indice_uv": np.round(rng.uniform(0.0, 11.0, size), 1),
+            "presion_atmosferica": np.round(rng.uniform(1000.0, 1025.0, size), 1),
+            "velocidad_viento": velocidad_viento,
+        }
+
+
+@instrument_stage()
+def insert_synthetic_weather_data(conn, num_records, seed=None, chunk_size=SYNTHETIC_CHUNK_SIZE, **kwargs):
+    """
+    Stream `generate_weather_chunks` into weather_data, one `executemany`
+    per chunk and a single commit. Extra arguments go to the generator.
+    """
+    try:
+        insert_query = f"""
+        INSERT INTO weather_data ({", ".join(SYNTHETIC_SCHEMA.names)})
+        VALUES ({", ".join("?" * len(SYNTHETIC_SCHEMA.names))});
+        """
+        total = 0
+        for chunk in generate_weather_chunks(num_records, seed=seed, chunk_size=chunk_size, **kwargs):
+            conn.executemany(insert_query, zip(*(chunk[name].tolist() for name in SYNTHETIC_SCHEMA.names)))
+            total += len(chunk["temperatura"])
+        conn.commit()
+        logging.info(f"{total} synthetic records inserted successfully.")
+        return total
+    except sqlite3.Error as e:
+        logging.error(f"Error inserting synthetic data: {e}")
+
+
+@instrument_stage()
+def write_synthetic_weather_parquet(output_path, num_records, seed=None, chunk_size=SYNTHETIC_CHUNK_SIZE,
+                                    compression="zstd", **kwargs):
+    """
+    Stream `generate_weather_chunks` into a Parquet file, one row group per chunk.
+    """
+    total = 0
+    with pq.ParquetWriter(output_path, SYNTHETIC_SCHEMA, compression=compression) as writer:
+        for chunk in generate_weather_chunks(num_records, seed=seed, chunk_size=chunk_size, **kwargs):
+            writer.write_table(pa.table(chunk, schema=SYNTHETIC_SCHEMA))
+            total += len(chunk["temperatura"])
+    logging.info(f"{total} synthetic records written to {output_path}.")
+    return total
+
+
+@instrument_stage()
 def insert_dummy_data_with_faker(conn, num_records=100):
     try:
         fake = Faker("es_CO") 
@@ -1,33 +1,63 @@
 import os
 import logging
+import argparse
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from core import (
     connect_to_db, 
     create_weather_table, 
     insert_dummy_data_with_faker, 
+    partition_weather_data,
     close_connection
 )
 from weather_data_transformations import (
     create_weather_data_fahrenheit_table,
-    populate_weather_data_fahrenheit,
     add_temperature_delta_columns,
-    calculate_temperature_deltas
+    TRANSFORM_BACKENDS
 )
+from weather_rollups import refresh_weather_rollups
+from common.instrumentation import instrument_stage, start_run, write_run_report
+from common.pipeline import Pipeline
+from common.database import get_backend
+from common.silver import write_silver, silver_path
+from common.export import export_table_to_csv, sqlite_table_schema, EXPORT_BATCH_SIZE
 
 logger = logging.getLogger()
 
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
-def export_table_to_csv(connection, table_name, export_path):
 
+def export_table_to_silver(connection, table_name, dataset_dir, batch_size=EXPORT_BATCH_SIZE * 10):
+    """
+    Stream a weather table into the silver dataset, partitioned by localidad
+    and month (`mes`, derived from fecha_y_hora) and sorted by time.
+    """
     try:
-        query = f"SELECT * FROM {table_name};"
-        df = pd.read_sql_query(query, connection)
-        df.to_csv(export_path, index=False)
-        logging.info(f"Table '{table_name}' exported to {export_path} successfully.")
+        schema = sqlite_table_schema(connection, table_name)
+        cursor = connection.execute(f"SELECT {', '.join(schema.names)} FROM {table_name};")
+
+        def batches():
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+                batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+                month = pc.utf8_slice_codeunits(batch.column("fecha_y_hora"), 0, 7)
+                yield pa.Table.from_batches([batch]).append_column("mes", month)
+
+        summary = write_silver(
+            batches(), dataset_dir, ["localidad", "mes"], sort_by=["fecha_y_hora", "id"],
+            schema=schema.append(pa.field("mes", pa.string()))
+        )
+        logging.info(f"Table '{table_name}' exported to silver dataset {dataset_dir} ({summary['rows']} rows).")
+        return summary
     except Exception as e:
-        logging.error(f"Failed to export table '{table_name}': {e}")
+        logging.error(f"Failed to export table '{table_name}' to the silver dataset: {e}")
 
 
+@instrument_stage()
 def export_table_schema(connection, table_name, export_path):
 
     try:
@@ -39,30 +69,40 @@ def export_table_schema(connection, table_name, export_path):
         logging.error(f"Failed to export schema for table '{table_name}': {e}")
 
 
-def main():
+def main(partition_by_month=False, backend="sql", incremental=False):
 
+    if incremental and backend != "sql":
+        raise ValueError("Incremental deltas are only supported by the sql backend.")
     db_path = os.path.join(os.path.dirname(__file__), "../database/weather_data.db")
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     export_dir = os.path.join(os.path.dirname(__file__), "../database_data")
     os.makedirs(export_dir, exist_ok=True)
+    report_path = os.path.join(os.path.dirname(__file__), "../logs/punto_3_run_report.json")
+    start_run("punto_3")
     connection = connect_to_db(db_path)
     num_records = 200  
 
+    transforms = TRANSFORM_BACKENDS[backend]
+    delta_kwargs = {"incremental": True} if incremental else {}
+
     if connection:
         try:
             create_weather_table(connection)
             insert_dummy_data_with_faker(connection, num_records)
 
             create_weather_data_fahrenheit_table(connection)
-            populate_weather_data_fahrenheit(connection)
+            transforms["populate_fahrenheit"](connection)
 
             add_temperature_delta_columns(connection)
-            calculate_temperature_deltas(connection)
+            transforms["calculate_deltas"](connection, **delta_kwargs)
+            refresh_weather_rollups(connection)
+            if partition_by_month:
+                partition_weather_data(connection, rebuild=True)
 
             export_table_to_csv(
-                connection=connection, 
-                table_name="weather_data", 
-                export_path=os.path.join(export_dir, "weather_data.csv")
+                conn=connection,
+                table_name="weather_data",
+                output_path=os.path.join(export_dir, "weather_data.csv")
             )
             export_table_schema(
                 connection=connection, 
@@ -70,22 +110,136 @@ def main():
                 export_path=os.path.join(export_dir, "weather_data_schema.csv")
             )
             export_table_to_csv(
-                connection=connection, 
-                table_name="weather_data_fahrenheit", 
-                export_path=os.path.join(export_dir, "weather_data_fahrenheit.csv")
+                conn=connection,
+                table_name="weather_data_fahrenheit",
+                output_path=os.path.join(export_dir, "weather_data_fahrenheit.csv")
             )
             export_table_schema(
                 connection=connection, 
                 table_name="weather_data_fahrenheit", 
                 export_path=os.path.join(export_dir, "weather_data_fahrenheit_schema.csv")
             )
+            for table_name in ("weather_data", "weather_data_fahrenheit"):
+                export_table_to_silver(
+                    connection=connection,
+                    table_name=table_name,
+                    dataset_dir=silver_path(os.path.join(os.path.dirname(__file__), ".."), table_name)
+                )
             logging.info("Process completed successfully.")
         except Exception as e:
             logging.error(f"An error occurred: {e}")
 
         finally:
             close_connection(connection)
+            write_run_report(report_path)
+
+
+def on_database(db_path, operation, **kwargs):
+    """
+    Run a single operation with a pooled connection, so pipeline stages can
+    run in separate threads without reopening the database each time.
+    """
+    with get_backend(db_path).connection() as connection:
+        return operation(connection, **kwargs)
+
+
+def build_pipeline(base_dir=BASE_DIR, num_records=200, backend="sql", partition_by_month=False,
+                   incremental=False):
+    """
+    Declare the `main` flow as a pipeline. The table transformations run in
+    order (plus the month tables with `partition_by_month`, as in `main`);
+    the exports (CSV, schemas and silver datasets) only depend on the last
+    transformation and run in parallel. `incremental` computes the deltas of
+    the new rows only (SQL backend).
+    """
+    db_path = os.path.join(base_dir, "database", "weather_data.db")
+    export_dir = os.path.join(base_dir, "database_data")
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    os.makedirs(export_dir, exist_ok=True)
+
+    if incremental and backend != "sql":
+        raise ValueError("Incremental deltas are only supported by the sql backend.")
+    pipeline = Pipeline("punto_3", state_dir=os.path.join(base_dir, "logs", "pipeline"))
+    transforms = TRANSFORM_BACKENDS[backend]
+    transformations = [
+        ("weather_table", create_weather_table, {}),
+        ("dummy_data", insert_dummy_data_with_faker, {"num_records": num_records}),
+        ("fahrenheit_table", create_weather_data_fahrenheit_table, {}),
+        ("fahrenheit_data", transforms["populate_fahrenheit"], {}),
+        ("delta_columns", add_temperature_delta_columns, {}),
+        ("temperature_deltas", transforms["calculate_deltas"], {"incremental": True} if incremental else {}),
+        ("weather_rollups", refresh_weather_rollups, {}),
+    ]
+    if partition_by_month:
+        transformations.append(("month_partitions", partition_weather_data, {"rebuild": True}))
+
+    previous = []
+    for name, operation, kwargs in transformations:
+        pipeline.add_stage(
+            name, on_database,
+            params={"db_path": db_path, "operation": operation, **kwargs},
+            after=previous,
+            output_files=[db_path]
+        )
+        previous = [name]
+
+    for table_name in ("weather_data", "weather_data_fahrenheit"):
+        csv_path = os.path.join(export_dir, f"{table_name}.csv")
+        schema_path = os.path.join(export_dir, f"{table_name}_schema.csv")
+        pipeline.add_stage(
+            f"export_{table_name}", on_database,
+            params={"db_path": db_path, "operation": export_table_to_csv,
+                    "table_name": table_name, "output_path": csv_path},
+            after=previous,
+            output_files=[csv_path]
+        )
+        pipeline.add_stage(
+            f"export_{table_name}_schema", on_database,
+            params={"db_path": db_path, "operation": export_table_schema,
+                    "table_name": table_name, "export_path": schema_path},
+            after=previous,
+            output_files=[schema_path]
+        )
+        pipeline.add_stage(
+            f"silver_{table_name}", on_database,
+            params={"db_path": db_path, "operation": export_table_to_silver,
+                    "table_name": table_name, "dataset_dir": silver_path(base_dir, table_name)},
+            after=previous,
+            output_files=[silver_path(base_dir, table_name)]
+        )
+    return pipeline
+
+
+def main_pipeline(force=False, num_records=200, backend="sql", partition_by_month=False, incremental=False):
+    start_run("punto_3_pipeline")
+    try:
+        build_pipeline(
+            num_records=num_records, backend=backend,
+            partition_by_month=partition_by_month, incremental=incremental
+        ).run(force=force)
+        logging.info("Pipeline completed successfully.")
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+    finally:
+        write_run_report(os.path.join(BASE_DIR, "logs", "punto_3_run_report.json"))
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Weather data generation and transformations.")
+    parser.add_argument("--pipeline", action="store_true", help="Run the flow as a DAG pipeline.")
+    parser.add_argument("--force", action="store_true", help="With --pipeline, run every stage.")
+    parser.add_argument("--partition-by-month", action="store_true",
+                        help="Also copy weather_data into month tables behind the weather_data_by_month view.")
+    parser.add_argument("--backend", choices=sorted(TRANSFORM_BACKENDS), default="sql",
+                        help="Compute the Fahrenheit table and the deltas in SQLite (sql) or with pandas/NumPy (pandas).")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Compute the temperature deltas of the newly inserted rows only (sql backend).")
+    args = parser.parse_args()
+    if args.incremental and args.backend != "sql":
+        parser.error("--incremental is only supported by the sql backend.")
+
+    if args.pipeline:
+        main_pipeline(force=args.force, backend=args.backend, partition_by_month=args.partition_by_month,
+                      incremental=args.incremental)
+    else:
+        main(partition_by_month=args.partition_by_month, backend=args.backend, incremental=args.incremental)
@@ -1,9 +1,24 @@
+import os
+import sys
 import sqlite3
 import logging
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.instrumentation import instrument_stage
 
 logger = logging.getLogger()
 
+READ_CHUNK_SIZE = 200000
+WEATHER_COLUMNS = [
+    "localidad", "pais", "temperatura", "fecha_y_hora", "cobertura_nubes",
+    "indice_uv", "presion_atmosferica", "velocidad_viento"
+]
+
 
+@instrument_stage()
 def create_weather_data_fahrenheit_table(conn):
 
     try:
@@ -30,16 +45,26 @@ def create_weather_data_fahrenheit_table(conn):
         logger.error(f"Error creating table 'weather_data_fahrenheit': {e}")
 
 
-def populate_weather_data_fahrenheit(conn):
+# Rows of weather_data not yet copied to weather_data_fahrenheit. Both tables
+# share ids, which is what the delta updates join on.
+NEW_FAHRENHEIT_ROWS = "id > (SELECT COALESCE(MAX(id), 0) FROM weather_data_fahrenheit)"
 
+
+@instrument_stage()
+def populate_weather_data_fahrenheit(conn):
+    """
+    Copy the weather_data rows not yet in weather_data_fahrenheit (same id),
+    so re-running the flow only converts the newly inserted readings.
+    """
     try:
         cursor = conn.cursor()
-        query = """
+        query = f"""
         INSERT INTO weather_data_fahrenheit (
-            localidad, pais, temperatura_fahrenheit, fecha_y_hora, cobertura_nubes,
+            id, localidad, pais, temperatura_fahrenheit, fecha_y_hora, cobertura_nubes,
             indice_uv, presion_atmosferica, velocidad_viento
         )
         SELECT
+            id,
             localidad,
             pais,
             temperatura * 1.8 + 32 AS temperatura_fahrenheit,
@@ -48,15 +73,17 @@ def populate_weather_data_fahrenheit(conn):
             indice_uv,
             presion_atmosferica,
             velocidad_viento
-        FROM weather_data;
+        FROM weather_data
+        WHERE {NEW_FAHRENHEIT_ROWS};
         """
         cursor.execute(query)
         conn.commit()
-        logger.info("Data successfully populated into 'weather_data_fahrenheit'.")
+        logger.info(f"Data successfully populated into 'weather_data_fahrenheit' ({cursor.rowcount} new rows).")
     except sqlite3.Error as e:
         logger.error(f"Error populating 'weather_data_fahrenheit': {e}")
 
 
+@instrument_stage()
 def add_temperature_delta_columns(conn):
 
     try:
@@ -71,72 +98,326 @@ def add_temperature_delta_columns(conn):
         logger.error(f"Error adding delta columns: {e}")
 
 
-def calculate_temperature_deltas(connection):
+def create_delta_watermark_table(cursor):
+    """
+    Per-localidad watermark of the delta computation: the last processed id
+    and the latest reading in hourly and daily order, used as LAG seeds.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS temperature_delta_watermarks (
+        localidad TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL,
+        hourly_id INTEGER NOT NULL,
+        hourly_fecha_y_hora DATETIME NOT NULL,
+        hourly_temperatura REAL NOT NULL,
+        daily_id INTEGER NOT NULL,
+        daily_fecha_y_hora DATETIME NOT NULL,
+        daily_temperatura REAL NOT NULL
+    );
+    """)
+
+
+# Latest processed reading per localidad in hourly and in daily order. As new
+# readings come after both, adding the two rows lets a single pass with both
+# LAG windows pick the right previous reading for each delta.
+LAG_SEEDS_QUERY = """
+SELECT hourly_id AS id, localidad, hourly_fecha_y_hora AS fecha_y_hora, hourly_temperatura AS temperatura,
+       1 AS is_seed
+FROM temperature_delta_watermarks
+UNION
+SELECT daily_id, localidad, daily_fecha_y_hora, daily_temperatura, 1
+FROM temperature_delta_watermarks
+"""
+
+
+def refresh_delta_watermarks(cursor, source):
+    """
+    Move the watermarks forward with the rows of `source`: per localidad, the
+    highest id and the latest reading in hourly and daily order (ties by id).
+    """
+    cursor.execute(f"""
+    WITH candidates AS (
+        SELECT id, localidad, fecha_y_hora FROM {source}
+        UNION ALL
+        SELECT hourly_id, localidad, hourly_fecha_y_hora FROM temperature_delta_watermarks
+        UNION ALL
+        SELECT daily_id, localidad, daily_fecha_y_hora FROM temperature_delta_watermarks
+    ),
+    latest AS (
+        SELECT
+            localidad,
+            MAX(id) AS last_id,
+            MAX(fecha_y_hora) AS last_hour,
+            MAX(DATE(fecha_y_hora)) AS last_day
+        FROM candidates
+        GROUP BY localidad
+    ),
+    seeds AS (
+        SELECT
+            latest.localidad,
+            latest.last_id,
+            MAX(CASE WHEN candidates.fecha_y_hora = latest.last_hour THEN candidates.id END) AS hourly_id,
+            MAX(CASE WHEN DATE(candidates.fecha_y_hora) = latest.last_day THEN candidates.id END) AS daily_id
+        FROM candidates
+        JOIN latest ON latest.localidad = candidates.localidad
+        GROUP BY latest.localidad
+    )
+    INSERT INTO temperature_delta_watermarks
+    SELECT
+        seeds.localidad, seeds.last_id,
+        hourly.id, hourly.fecha_y_hora, hourly.temperatura,
+        daily.id, daily.fecha_y_hora, daily.temperatura
+    FROM seeds
+    JOIN weather_data AS hourly ON hourly.id = seeds.hourly_id
+    JOIN weather_data AS daily ON daily.id = seeds.daily_id
+    WHERE true
+    ON CONFLICT(localidad) DO UPDATE SET
+        last_id = excluded.last_id,
+        hourly_id = excluded.hourly_id,
+        hourly_fecha_y_hora = excluded.hourly_fecha_y_hora,
+        hourly_temperatura = excluded.hourly_temperatura,
+        daily_id = excluded.daily_id,
+        daily_fecha_y_hora = excluded.daily_fecha_y_hora,
+        daily_temperatura = excluded.daily_temperatura;
+    """)
+
+
+def create_temperature_deltas_table(cursor):
+    cursor.execute("DROP TABLE IF EXISTS temp.temperature_deltas;")
+    cursor.execute("""
+    CREATE TEMP TABLE temperature_deltas (
+        id INTEGER PRIMARY KEY,
+        delta_horaria REAL,
+        delta_diaria REAL
+    );
+    """)
+
+
+def apply_temperature_deltas(cursor):
+    """
+    Copy the deltas in the `temperature_deltas` temp table to both tables,
+    driving the UPDATE from the temp table (rowid lookups on the target).
+    """
+    for table_name in ("weather_data", "weather_data_fahrenheit"):
+        if sqlite3.sqlite_version_info >= (3, 33, 0):
+            cursor.execute(f"""
+            UPDATE {table_name}
+            SET delta_temperatura_horaria = deltas.delta_horaria,
+                delta_temperatura_diaria = deltas.delta_diaria
+            FROM temperature_deltas AS deltas
+            WHERE {table_name}.id = +deltas.id;
+            """)
+        else:
+            cursor.execute(f"""
+            UPDATE {table_name}
+            SET delta_temperatura_horaria = (
+                    SELECT delta_horaria FROM temperature_deltas WHERE temperature_deltas.id = {table_name}.id
+                ),
+                delta_temperatura_diaria = (
+                    SELECT delta_diaria FROM temperature_deltas WHERE temperature_deltas.id = {table_name}.id
+                )
+            WHERE id IN (SELECT id FROM temperature_deltas);
+            """)
+
+
+@instrument_stage()
+def calculate_temperature_deltas(connection, incremental=False):
     """
     Calculate temperature deltas and update the tables.
+
+    Both deltas are computed in a single window-function pass into a temp
+    table keyed by id (so lookups go through its primary key) and applied
+    with one `UPDATE ... FROM` join per table. Rows with the same timestamp
+    (or day) in a localidad are ordered by id. SQLite < 3.33 has no
+    `UPDATE ... FROM`; there the update falls back to a subquery per column
+    against the same indexed temp table.
+
+    With `incremental=True` only rows inserted after the last run (id above
+    the watermarks) are computed, seeding LAG with the previous latest
+    reading of each localidad, so the cost follows the batch size. This
+    assumes readings arrive in time order per localidad; run a full
+    computation after loading late or backdated rows.
     """
     try:
         cursor = connection.cursor()
+        create_delta_watermark_table(cursor)
 
-        # Calcular deltas horarios
-        cursor.execute("""
-        CREATE TEMP TABLE IF NOT EXISTS DeltaHourly AS
-        SELECT 
-            id, 
-            temperatura - LAG(temperatura) OVER (
-                PARTITION BY localidad ORDER BY fecha_y_hora
-            ) AS delta_horaria
-        FROM weather_data;
-        """)
+        if incremental:
+            cursor.execute("DROP TABLE IF EXISTS temp.delta_rows;")
+            cursor.execute("""
+            CREATE TEMP TABLE delta_rows AS
+            SELECT id, localidad, fecha_y_hora, temperatura
+            FROM weather_data
+            WHERE id > (SELECT COALESCE(MAX(last_id), 0) FROM temperature_delta_watermarks);
+            """)
+            source = "temp.delta_rows"
+        else:
+            cursor.execute("DELETE FROM temperature_delta_watermarks;")
+            source = "weather_data"
 
-        cursor.execute("""
-        UPDATE weather_data
-        SET delta_temperatura_horaria = (
-            SELECT delta_horaria
-            FROM DeltaHourly
-            WHERE DeltaHourly.id = weather_data.id
-        );
+        create_temperature_deltas_table(cursor)
+        cursor.execute(f"""
+        INSERT INTO temperature_deltas (id, delta_horaria, delta_diaria)
+        SELECT id, delta_horaria, delta_diaria
+        FROM (
+            SELECT
+                id,
+                is_seed,
+                temperatura - LAG(temperatura) OVER (
+                    PARTITION BY localidad ORDER BY fecha_y_hora, id
+                ) AS delta_horaria,
+                temperatura - LAG(temperatura) OVER (
+                    PARTITION BY localidad ORDER BY DATE(fecha_y_hora), id
+                ) AS delta_diaria
+            FROM (
+                SELECT id, localidad, fecha_y_hora, temperatura, 0 AS is_seed FROM {source}
+                UNION ALL
+                SELECT * FROM ({LAG_SEEDS_QUERY})
+            )
+        )
+        WHERE is_seed = 0;
         """)
 
-        cursor.execute("""
-        UPDATE weather_data_fahrenheit
-        SET delta_temperatura_horaria = (
-            SELECT delta_horaria
-            FROM DeltaHourly
-            WHERE DeltaHourly.id = weather_data_fahrenheit.id
-        );
-        """)
+        apply_temperature_deltas(cursor)
 
-        # Calcular deltas diarios
-        cursor.execute("""
-        CREATE TEMP TABLE IF NOT EXISTS DeltaDaily AS
-        SELECT 
-            id, 
-            temperatura - LAG(temperatura) OVER (
-                PARTITION BY localidad ORDER BY DATE(fecha_y_hora)
-            ) AS delta_diaria
-        FROM weather_data;
-        """)
+        refresh_delta_watermarks(cursor, source)
+        cursor.execute("DROP TABLE temp.temperature_deltas;")
+        cursor.execute("DROP TABLE IF EXISTS temp.delta_rows;")
+        connection.commit()
+        logger.info(
+            f"Temperature deltas calculated and updated successfully "
+            f"({'incremental' if incremental else 'full'} run)."
+        )
+    except sqlite3.Error as e:
+        logger.error(f"Error calculating temperature deltas: {e}")
 
-        cursor.execute("""
-        UPDATE weather_data
-        SET delta_temperatura_diaria = (
-            SELECT delta_diaria
-            FROM DeltaDaily
-            WHERE DeltaDaily.id = weather_data.id
-        );
-        """)
 
-        cursor.execute("""
-        UPDATE weather_data_fahrenheit
-        SET delta_temperatura_diaria = (
-            SELECT delta_diaria
-            FROM DeltaDaily
-            WHERE DeltaDaily.id = weather_data_fahrenheit.id
-        );
-        """)
+def read_weather_chunks(conn, columns, chunk_size=READ_CHUNK_SIZE, where=None):
+    """
+    Read weather_data in chunks of `chunk_size` rows, ordered by id,
+    optionally filtered by a `where` condition.
+    """
+    condition = f" WHERE {where}" if where else ""
+    query = f"SELECT {', '.join(columns)} FROM weather_data{condition} ORDER BY id;"
+    return pd.read_sql_query(query, conn, chunksize=chunk_size)
+
+
+def frame_rows(df):
+    """
+    Rows of a DataFrame as plain Python tuples for `executemany` (much faster
+    than `itertuples`). SQLite stores the NaN of missing values as NULL.
+    """
+    return zip(*(df[column].tolist() for column in df.columns))
+
+
+@instrument_stage()
+def populate_weather_data_fahrenheit_pandas(conn, chunk_size=READ_CHUNK_SIZE):
+    """
+    Pandas version of `populate_weather_data_fahrenheit`: converts each chunk
+    of new rows with vectorized operations and inserts it with one
+    `executemany`.
+    """
+    try:
+        insert_query = """
+        INSERT INTO weather_data_fahrenheit (
+            id, localidad, pais, temperatura_fahrenheit, fecha_y_hora, cobertura_nubes,
+            indice_uv, presion_atmosferica, velocidad_viento
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+        """
+        total = 0
+        columns = ["id"] + WEATHER_COLUMNS
+        for chunk in read_weather_chunks(conn, columns, chunk_size, where=NEW_FAHRENHEIT_ROWS):
+            chunk["temperatura"] = chunk["temperatura"] * 1.8 + 32
+            # Same as DATE(fecha_y_hora) for 'YYYY-MM-DD HH:MM:SS' values.
+            chunk["fecha_y_hora"] = chunk["fecha_y_hora"].str.slice(0, 10)
+            conn.executemany(insert_query, frame_rows(chunk))
+            total += len(chunk)
+        conn.commit()
+        logger.info(f"Data successfully populated into 'weather_data_fahrenheit' ({total} new rows, pandas).")
+    except sqlite3.Error as e:
+        logger.error(f"Error populating 'weather_data_fahrenheit': {e}")
+
+
+def lag_deltas(codes, sort_key, ids, temperatura):
+    """
+    `temperatura - LAG(temperatura)` per localidad code ordered by
+    (`sort_key`, id), returned in the input order (NaN for the first reading).
+    """
+    order = np.lexsort((ids, sort_key, codes))
+    sorted_temperatura = temperatura[order]
+    deltas = np.empty(len(order))
+    deltas[0:1] = np.nan
+    deltas[1:] = sorted_temperatura[1:] - sorted_temperatura[:-1]
+    sorted_codes = codes[order]
+    deltas[1:][sorted_codes[1:] != sorted_codes[:-1]] = np.nan
+    result = np.empty(len(order))
+    result[order] = deltas
+    return result
+
+
+def localidad_deltas(data):
+    """
+    Hourly and daily deltas for a subset of localidades.
+    """
+    fecha_y_hora = data["fecha_y_hora"]
+    codes = data["codes"].to_numpy()
+    ids = data["id"].to_numpy()
+    temperatura = data["temperatura"].to_numpy(dtype=float)
+    hours = pd.factorize(fecha_y_hora, sort=True)[0]
+    days = pd.factorize(fecha_y_hora.str.slice(0, 10), sort=True)[0]
+    return pd.DataFrame({
+        "id": ids,
+        "delta_horaria": lag_deltas(codes, hours, ids, temperatura),
+        "delta_diaria": lag_deltas(codes, days, ids, temperatura),
+    })
+
 
+@instrument_stage()
+def calculate_temperature_deltas_pandas(connection, workers=None, chunk_size=READ_CHUNK_SIZE):
+    """
+    Pandas/NumPy version of `calculate_temperature_deltas` (full run): reads
+    weather_data in chunks, computes the LAG deltas per localidad with sorted
+    vectorized differences, with the localidades split across `workers`
+    threads, and writes them back in bulk through the same temp table and
+    `UPDATE ... FROM` as the SQL path. The watermarks are refreshed as well.
+    """
+    try:
+        data = pd.concat(
+            read_weather_chunks(connection, ["id", "localidad", "fecha_y_hora", "temperatura"], chunk_size),
+            ignore_index=True
+        )
+        cursor = connection.cursor()
+        create_delta_watermark_table(cursor)
+        cursor.execute("DELETE FROM temperature_delta_watermarks;")
+        create_temperature_deltas_table(cursor)
+
+        if not data.empty:
+            data["codes"] = pd.factorize(data["localidad"])[0]
+            workers = max(1, min(workers or os.cpu_count() or 1, data["codes"].max() + 1))
+            groups = [data[data["codes"] % workers == worker] for worker in range(workers)]
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                deltas = pd.concat(executor.map(localidad_deltas, groups), ignore_index=True)
+            cursor.executemany(
+                "INSERT INTO temperature_deltas (id, delta_horaria, delta_diaria) VALUES (?, ?, ?);",
+                frame_rows(deltas)
+            )
+
+        apply_temperature_deltas(cursor)
+        refresh_delta_watermarks(cursor, "weather_data")
+        cursor.execute("DROP TABLE temp.temperature_deltas;")
         connection.commit()
-        logger.info("Temperature deltas calculated and updated successfully.")
+        logger.info("Temperature deltas calculated and updated successfully (pandas backend).")
     except sqlite3.Error as e:
         logger.error(f"Error calculating temperature deltas: {e}")
+
+
+TRANSFORM_BACKENDS = {
+    "sql": {
+        "populate_fahrenheit": populate_weather_data_fahrenheit,
+        "calculate_deltas": calculate_temperature_deltas,
+    },
+    "pandas": {
+        "populate_fahrenheit": populate_weather_data_fahrenheit_pandas,
+        "calculate_deltas": calculate_temperature_deltas_pandas,
+    },
+}
@@ -0,0 +1,195 @@
+import os
+import sys
+import sqlite3
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.instrumentation import instrument_stage
+
+logger = logging.getLogger()
+
+# Rollup table -> period column and the expression that derives it from the
+# daily staging rows (`fecha` is DATE(fecha_y_hora)).
+ROLLUPS = {
+    "weather_daily_rollup": ("fecha", "fecha"),
+    "weather_monthly_rollup": ("mes", "SUBSTR(fecha, 1, 7)"),
+}
+ROLLUP_WATERMARKS = "weather_rollup_watermarks"
+MONTHLY_AVERAGE_VIEW = "mv_avg_temperatura_por_mes"
+
+# Sums and counts are stored next to each average so new rows can be merged
+# into an existing period without rescanning weather_data.
+SUMMED_COLUMNS = (
+    "readings", "sum_temperatura", "uv_readings", "sum_indice_uv", "wind_readings", "sum_velocidad_viento"
+)
+AVERAGES = {
+    "avg_temperatura": ("sum_temperatura", "readings"),
+    "avg_indice_uv": ("sum_indice_uv", "uv_readings"),
+    "avg_velocidad_viento": ("sum_velocidad_viento", "wind_readings"),
+}
+
+
+def create_rollup_tables(conn):
+    """
+    Create the daily and monthly per-localidad rollup tables, their watermark
+    table and the `mv_avg_temperatura_por_mes` view described in parte_2.md.
+    """
+    cursor = conn.cursor()
+    for table_name, (period, _) in ROLLUPS.items():
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            localidad TEXT NOT NULL,
+            {period} TEXT NOT NULL,
+            readings INTEGER NOT NULL,
+            min_temperatura REAL,
+            max_temperatura REAL,
+            sum_temperatura REAL,
+            avg_temperatura REAL,
+            uv_readings INTEGER NOT NULL,
+            sum_indice_uv REAL,
+            avg_indice_uv REAL,
+            wind_readings INTEGER NOT NULL,
+            sum_velocidad_viento REAL,
+            avg_velocidad_viento REAL,
+            max_velocidad_viento REAL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (localidad, {period})
+        ) WITHOUT ROWID;
+        """)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_{period} ON {table_name} ({period});")
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {ROLLUP_WATERMARKS} (
+        source_table TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL
+    );
+    """)
+    cursor.execute(f"""
+    CREATE VIEW IF NOT EXISTS {MONTHLY_AVERAGE_VIEW} AS
+    SELECT mes, SUM(sum_temperatura) / SUM(readings) AS avg_temperatura
+    FROM weather_monthly_rollup
+    GROUP BY mes;
+    """)
+    conn.commit()
+
+
+def upsert_rollup(cursor, table_name, period, period_expression):
+    """
+    Merge the `rollup_staging` rows into `table_name`: counts and sums are
+    added, minimums and maximums combined and averages recomputed.
+    """
+    # SUM() of a group without values is NULL, and NULL + x would lose the
+    # total already stored; multi-argument MIN/MAX return NULL the same way.
+    merged = [f"{column} = COALESCE({column}, 0) + COALESCE(excluded.{column}, 0)" for column in SUMMED_COLUMNS]
+    merged.append("min_temperatura = MIN(COALESCE(min_temperatura, excluded.min_temperatura), "
+                  "COALESCE(excluded.min_temperatura, min_temperatura))")
+    merged += [
+        f"{column} = MAX(COALESCE({column}, excluded.{column}), COALESCE(excluded.{column}, {column}))"
+        for column in ("max_temperatura", "max_velocidad_viento")
+    ]
+    merged += [
+        f"{column} = (COALESCE({total}, 0) + COALESCE(excluded.{total}, 0)) / NULLIF({count} + excluded.{count}, 0)"
+        for column, (total, count) in AVERAGES.items()
+    ]
+    merged.append("updated_at = CURRENT_TIMESTAMP")
+
+    cursor.execute(f"""
+    INSERT INTO {table_name} (
+        localidad, {period}, readings, min_temperatura, max_temperatura, sum_temperatura, avg_temperatura,
+        uv_readings, sum_indice_uv, avg_indice_uv,
+        wind_readings, sum_velocidad_viento, avg_velocidad_viento, max_velocidad_viento
+    )
+    SELECT
+        localidad,
+        {period_expression} AS period,
+        SUM(readings), MIN(min_temperatura), MAX(max_temperatura), SUM(sum_temperatura),
+        SUM(sum_temperatura) / NULLIF(SUM(readings), 0),
+        SUM(uv_readings), SUM(sum_indice_uv), SUM(sum_indice_uv) / NULLIF(SUM(uv_readings), 0),
+        SUM(wind_readings), SUM(sum_velocidad_viento),
+        SUM(sum_velocidad_viento) / NULLIF(SUM(wind_readings), 0), MAX(max_velocidad_viento)
+    FROM rollup_staging
+    GROUP BY localidad, period
+    ON CONFLICT(localidad, {period}) DO UPDATE SET
+        {", ".join(merged)};
+    """)
+
+
+@instrument_stage()
+def refresh_weather_rollups(conn, rebuild=False):
+    """
+    Bring the rollup tables up to date with the weather_data rows added since
+    the last refresh (ids above the watermark, read by range on the primary
+    key). The new rows are aggregated once per localidad and day, and that
+    staging table feeds both rollups. With `rebuild=True` the rollups are
+    emptied and recomputed from the whole table. Like the incremental deltas,
+    it assumes weather_data only receives new rows.
+    """
+    try:
+        create_rollup_tables(conn)
+        cursor = conn.cursor()
+        if rebuild:
+            for table_name in ROLLUPS:
+                cursor.execute(f"DELETE FROM {table_name};")
+            cursor.execute(f"DELETE FROM {ROLLUP_WATERMARKS};")
+
+        watermark = cursor.execute(
+            f"SELECT last_id FROM {ROLLUP_WATERMARKS} WHERE source_table = 'weather_data';"
+        ).fetchone()
+        last_id = watermark[0] if watermark else 0
+        max_id = cursor.execute("SELECT MAX(id) FROM weather_data;").fetchone()[0] or 0
+
+        cursor.execute("DROP TABLE IF EXISTS temp.rollup_staging;")
+        cursor.execute("""
+        CREATE TEMP TABLE rollup_staging AS
+        SELECT
+            localidad,
+            DATE(fecha_y_hora) AS fecha,
+            COUNT(*) AS readings,
+            MIN(temperatura) AS min_temperatura,
+            MAX(temperatura) AS max_temperatura,
+            SUM(temperatura) AS sum_temperatura,
+            COUNT(indice_uv) AS uv_readings,
+            SUM(indice_uv) AS sum_indice_uv,
+            COUNT(velocidad_viento) AS wind_readings,
+            SUM(velocidad_viento) AS sum_velocidad_viento,
+            MAX(velocidad_viento) AS max_velocidad_viento
+        FROM weather_data
+        WHERE id > ? AND id <= ?
+        GROUP BY localidad, fecha;
+        """, (last_id, max_id))
+
+        for table_name, (period, period_expression) in ROLLUPS.items():
+            upsert_rollup(cursor, table_name, period, period_expression)
+        cursor.execute(f"""
+        INSERT INTO {ROLLUP_WATERMARKS} (source_table, last_id) VALUES ('weather_data', ?)
+        ON CONFLICT(source_table) DO UPDATE SET last_id = excluded.last_id;
+        """, (max_id,))
+
+        staged = cursor.execute("SELECT COALESCE(SUM(readings), 0) FROM rollup_staging;").fetchone()[0]
+        cursor.execute("DROP TABLE temp.rollup_staging;")
+        conn.commit()
+        logger.info(f"Weather rollups refreshed with {staged} new rows (ids {last_id + 1} to {max_id}).")
+        return staged
+    except sqlite3.Error as e:
+        conn.rollback()
+        logger.error(f"Error refreshing weather rollups: {e}")
+
+
+def query_rollup(conn, granularity="monthly", localidad=None, start=None, end=None):
+    """
+    Read a rollup as a list of rows, optionally filtered by localidad and by
+    period (`start` inclusive, `end` exclusive, same format as the period).
+    """
+    table_name = "weather_monthly_rollup" if granularity == "monthly" else "weather_daily_rollup"
+    period = ROLLUPS[table_name][0]
+    conditions, params = [], []
+    for condition, value in [("localidad = ?", localidad), (f"{period} >= ?", start), (f"{period} < ?", end)]:
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return conn.execute(f"""
+    SELECT localidad, {period}, readings, min_temperatura, max_temperatura, avg_temperatura,
+           avg_indice_uv, avg_velocidad_viento, max_velocidad_viento
+    FROM {table_name} {where}
+    ORDER BY localidad, {period};
+    """, params).fetchall()